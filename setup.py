@@ -51,6 +51,9 @@ setup(
             "flake8>=3.9",
             "mypy>=0.910",
         ],
+        "lite": [
+            "ai-edge-litert>=1.0.0",
+        ],
         "notebooks": [
             "jupyter>=1.0.0",
             "notebook>=6.0.0",
@@ -15,6 +15,7 @@ try:
         get_card_by_id,
         get_card_by_sample_id,
         get_card,
+        get_cards,
         get_project_by_id,
         get_project_by_name,
         get_project,
@@ -25,7 +26,11 @@ try:
         show_cards,
         get_models,
         get_model,
+        metadata_session,
+        enable_metadata_memo,
+        disable_metadata_memo,
         predict,
+        preload_models,
         show_prediction,
         apply_predictions_to_dataframe,
         get_model_dataset_mapping,
@@ -51,6 +56,11 @@ try:
     from . import intensityFind
     from . import pixelProcessing
     from . import regionRoutine
+    from . import pls_model
+    from . import nn_inference
+    from . import model_cache
+    from . import http_client
+    from . import metadata_cache
 except ImportError as e:
     import warnings
     warnings.warn(f"Could not import some submodules: {e}")
@@ -68,6 +78,7 @@ if _PADANALYTICS_IMPORTED:
         "get_card_by_id",
         "get_card_by_sample_id",
         "get_card",
+        "get_cards",
         "get_project_by_id",
         "get_project_by_name", 
         "get_project",
@@ -78,7 +89,11 @@ if _PADANALYTICS_IMPORTED:
         "show_cards",
         "get_models",
         "get_model", 
+        "metadata_session",
+        "enable_metadata_memo",
+        "disable_metadata_memo",
         "predict",
+        "preload_models",
         "show_prediction",
         "apply_predictions_to_dataframe",
         "get_model_dataset_mapping",
@@ -92,6 +107,6 @@ if _PADANALYTICS_IMPORTED:
     ])
 
 # Add available submodules
-for module_name in ["pad_analysis", "pad_helper", "fileManagement", "intensityFind", "pixelProcessing", "regionRoutine"]:
+for module_name in ["pad_analysis", "pad_helper", "fileManagement", "intensityFind", "pixelProcessing", "regionRoutine", "pls_model", "nn_inference", "model_cache", "http_client", "metadata_cache"]:
     if module_name in globals():
         __all__.append(module_name)
@@ -0,0 +1,108 @@
+"""Shared HTTP client for the PAD API and image server.
+
+All requests of the package go through one requests.Session per process, so
+connections to pad.crc.nd.edu are kept alive and reused instead of paying a
+new TCP and TLS handshake for every card, model and image. The session's
+connection pools are sized by PadClient's arguments; configure_client
+replaces the shared client, e.g. for larger pools in threaded batch jobs or
+a stand-in server in tests.
+"""
+
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Hosts with their own connection pool
+POOL_CONNECTIONS = 10
+
+# Connections kept alive per host, the most useful concurrent requests
+POOL_MAXSIZE = 32
+
+# Seconds to wait for a connection and for each read, None for no limit
+TIMEOUT = None
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+class PadClient:
+    """requests.Session with keep-alive connection pools of a set size.
+
+    Parameters:
+        pool_connections (int): Hosts to keep connection pools for.
+        pool_maxsize (int): Connections kept alive per host.
+        max_retries (int): Retries of failed connections (not of responses).
+        timeout (float or tuple, optional): Default timeout of requests.
+        headers (dict, optional): Headers sent with every request.
+    """
+
+    def __init__(
+        self,
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        max_retries=0,
+        timeout=TIMEOUT,
+        headers=None,
+    ):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=max_retries,
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+    def get(self, url, **kwargs):
+        """GET url on a pooled connection; takes the requests.get arguments."""
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def close(self):
+        """Close every pooled connection."""
+        self.session.close()
+
+
+def get_client():
+    """The shared PadClient of this process, created on first use.
+
+    A forked worker process gets its own client rather than sharing the
+    parent's sockets.
+    """
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = PadClient()
+            _client_pid = os.getpid()
+        return _client
+
+
+def configure_client(client=None, **kwargs):
+    """Replace the shared client.
+
+    Parameters:
+        client (PadClient, optional): The new client; by default one is
+            created from kwargs, the PadClient arguments.
+
+    Returns:
+        PadClient: The new shared client.
+    """
+    global _client, _client_pid
+    if client is None:
+        client = PadClient(**kwargs)
+    with _client_lock:
+        old, _client, _client_pid = _client, client, os.getpid()
+    if old is not None and old is not client:
+        old.close()
+    return client
+
+
+def get(url, **kwargs):
+    """GET url with the shared client; takes the requests.get arguments."""
+    return get_client().get(url, **kwargs)
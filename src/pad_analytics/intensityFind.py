@@ -1,6 +1,7 @@
 import cv2 as cv
 import numpy as np
 import math
+import functools
 
 BLACK_THRESH_S = 35
 BLACK_THRESH_V = 70
@@ -24,31 +25,62 @@ def findMaxIntensities(img):
 
 # Takes a HSV image and returns a list of the most intense pixels in it,
 # after applying filtering to minimize black bars on the edges
-def findMaxIntensitiesFiltered(img):
-    imgS = img[:, :, 1]
-    imgV = img[:, :, 2]
-    maxI = 0
-    maxSet = []
-    centerX = imgS.shape[0] / 2
-    centerY = imgS.shape[1] / 2
-    # print("centers x/y", centerX, centerY)
-    for i in range(imgS.shape[0]):
-        dX = abs(centerX - i)
-        for j in range(imgS.shape[1]):
-            dY = abs(centerY - j)
-            sF = cosCorrectFactor(dX, dY, centerX, centerY)
-            cS = sF * imgS[i, j]
-            cV = sF * imgV[i, j]
-            if cS <= BLACK_THRESH_S and cV <= BLACK_THRESH_V:
-                pass
-            else:
-                maxSet.append((i, j))
-            # elif cS > maxI:
-            #   maxI = imgS[i,j]
-            #   maxSet = [(i,j)]
-            # elif cS == maxI:
-            #   maxSet.append((i,j))
-    return maxSet
+def findMaxIntensitiesFiltered(img, asMask=False):
+    mask = findMaxIntensitiesFilteredMask(img)
+    if asMask:
+        return mask
+    return [tuple(pixel) for pixel in np.argwhere(mask).tolist()]
+
+
+# Takes a HSV image and returns a boolean mask of the pixels kept by
+# findMaxIntensitiesFiltered, computed in one pass over the whole ROI
+def findMaxIntensitiesFilteredMask(img):
+    threshS, threshV = cosThresholdGrids(img.shape[0], img.shape[1])
+    return (img[:, :, 1] > threshS) | (img[:, :, 2] > threshV)
+
+
+# Returns the cosCorrectFactor weight of every pixel of a ROI with the given
+# shape. Only depends on the shape, so it is built once and cached. The weight
+# of a pixel is the cosine of its largest relative distance to the center,
+# i.e. the smaller of the row and column weights, so it is assembled from two
+# 1D tables with the same math.cos calls findMaxIntensitiesFiltered used to make.
+@functools.lru_cache(maxsize=64)
+def cosWeightGrid(rows, cols):
+    centerX = rows / 2
+    centerY = cols / 2
+    rowW = np.array(
+        [math.cos((math.pi / 2) * (abs(centerX - i) / centerX)) for i in range(rows)]
+    )
+    colW = np.array(
+        [math.cos((math.pi / 2) * (abs(centerY - j) / centerY)) for j in range(cols)]
+    )
+    grid = np.minimum.outer(rowW, colW)
+    grid.setflags(write=False)
+    return grid
+
+
+# Returns, for every pixel of a ROI with the given shape, the largest S and V
+# values that are still scaled under BLACK_THRESH_S / BLACK_THRESH_V by the
+# cosine weight. weight * value grows with value, so comparing the raw uint8
+# planes against these grids selects the same pixels as the float test.
+@functools.lru_cache(maxsize=64)
+def cosThresholdGrids(rows, cols):
+    return thresholdGrids(cosWeightGrid(rows, cols))
+
+
+def thresholdGrids(weights):
+    grids = []
+    for thresh in (BLACK_THRESH_S, BLACK_THRESH_V):
+        # floor(thresh / weight) can be one off after rounding, so step it
+        # with the exact weight * value <= thresh test used by the mask
+        with np.errstate(divide="ignore"):
+            grid = np.floor(np.clip(thresh / weights, 0, 255))
+        grid = np.where(weights * grid > thresh, grid - 1, grid)
+        step = (grid < 255) & (weights * (grid + 1) <= thresh)
+        grid = np.where(step, grid + 1, grid).astype(np.uint8)
+        grid.setflags(write=False)
+        grids.append(grid)
+    return tuple(grids)
 
 
 # Takes a distance from a center and returns a weight between 0 and 1
@@ -0,0 +1,283 @@
+"""Opt-in on-disk cache of PAD API metadata responses.
+
+Cards, projects and neural network metadata rarely change, so their JSON
+responses can be kept in a SQLite file and reused across sessions. Each
+response is fresh for the TTL of its endpoint (see DEFAULT_TTLS); a stale
+response is revalidated with If-None-Match / If-Modified-Since when the
+server sent an ETag or Last-Modified, so unchanged data is not downloaded
+again. The least recently used responses are evicted beyond max_bytes of
+compressed JSON. In offline mode only cached responses are used, whatever
+their age.
+
+The cache is off by default. Turn it on with enable_metadata_cache() or the
+PAD_METADATA_CACHE environment variable (a file path, or 1 for
+~/.cache/pad_analytics/metadata.sqlite); PAD_OFFLINE=1 starts it offline,
+enabling it at the default path if PAD_METADATA_CACHE is not set.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+import requests
+
+from . import http_client
+
+# Seconds a response stays fresh, by endpoint
+DEFAULT_TTLS = {
+    "cards": 7 * 24 * 3600,
+    "project_cards": 3600,
+    "card_listings": 3600,
+    "projects": 24 * 3600,
+    "models": 24 * 3600,
+    "default": 3600,
+}
+
+# Endpoint of a request URL, first match wins
+ENDPOINTS = [
+    (re.compile(r"/projects/[^/]+/cards/?$"), "project_cards"),
+    (re.compile(r"/cards/by-sample/"), "card_listings"),
+    (re.compile(r"/cards/issues/?$"), "card_listings"),
+    (re.compile(r"/cards/"), "cards"),
+    (re.compile(r"/projects"), "projects"),
+    (re.compile(r"/neural-networks"), "models"),
+]
+
+# Compressed bytes kept before the least recently used responses are evicted
+MAX_BYTES = 256 * 1024 * 1024
+
+_cache = None
+_cache_checked = False
+_cache_lock = threading.Lock()
+
+
+class OfflineCacheMiss(requests.exceptions.ConnectionError):
+    """A request in offline mode whose response is not cached."""
+
+
+def endpoint(url):
+    """Endpoint name of a request URL, a key of DEFAULT_TTLS."""
+    for pattern, name in ENDPOINTS:
+        if pattern.search(url):
+            return name
+    return "default"
+
+
+class MetadataCache:
+    """SQLite store of JSON API responses with TTLs and revalidation.
+
+    Parameters:
+        path (str): SQLite file, created if needed.
+        ttls (dict, optional): Seconds of freshness by endpoint, overriding
+            DEFAULT_TTLS.
+        max_bytes (int): Compressed bytes kept before eviction.
+        offline (bool): Only answer from the cache, never the network.
+    """
+
+    def __init__(self, path, ttls=None, max_bytes=MAX_BYTES, offline=False):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._db:
+            self._db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT PRIMARY KEY,
+                    body BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )""")
+
+    def ttl(self, url):
+        return self.ttls.get(endpoint(url), self.ttls["default"])
+
+    def _lookup(self, url):
+        with self._lock:
+            return self._db.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM responses WHERE url = ?",
+                (url,),
+            ).fetchone()
+
+    def _touch(self, url, now, fetched=False):
+        with self._lock, self._db:
+            if fetched:
+                self._db.execute(
+                    "UPDATE responses SET fetched_at = ?, accessed_at = ? WHERE url = ?",
+                    (now, now, url),
+                )
+            else:
+                self._db.execute(
+                    "UPDATE responses SET accessed_at = ? WHERE url = ?", (now, url)
+                )
+
+    def _store(self, url, response, now):
+        body = zlib.compress(response.content)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    body,
+                    len(body),
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    now,
+                    now,
+                ),
+            )
+            self._evict()
+
+    def _evict(self):
+        (total,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute(
+            "SELECT url, size FROM responses ORDER BY accessed_at"
+        ).fetchall()
+        for url, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM responses WHERE url = ?", (url,))
+            total -= size
+
+    def get_json(self, url, validate=None, check_status=True, **kwargs):
+        """JSON response of url, from the cache when fresh.
+
+        Parameters:
+            url (str): Request URL, also the cache key.
+            validate (callable, optional): Called with the decoded response;
+                responses it returns False for are returned but not cached.
+            check_status (bool): Raise for error statuses. If False, the
+                JSON body of an error response is returned, not cached.
+            **kwargs: requests.get arguments for network requests.
+
+        Raises:
+            OfflineCacheMiss: In offline mode, if url is not cached.
+            requests.exceptions.RequestException: If the request fails.
+        """
+        now = time.time()
+        cached = self._lookup(url)
+        if cached is not None:
+            body, etag, last_modified, fetched_at = cached
+            if self.offline or now - fetched_at < self.ttl(url):
+                self.hits += 1
+                self._touch(url, now)
+                return json.loads(zlib.decompress(body))
+        elif self.offline:
+            raise OfflineCacheMiss(f"{url} is not in the metadata cache")
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        if cached is not None:
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        response = http_client.get(url, headers=headers, **kwargs)
+        if cached is not None and response.status_code == 304:
+            self.revalidated += 1
+            self._touch(url, now, fetched=True)
+            return json.loads(zlib.decompress(body))
+
+        if check_status:
+            response.raise_for_status()
+        data = response.json()
+        self.misses += 1
+        if response.ok and (validate is None or validate(data)):
+            self._store(url, response, now)
+        return data
+
+    def clear(self):
+        """Forget every cached response."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM responses")
+
+    def close(self):
+        self._db.close()
+
+
+def default_path():
+    return os.path.join(
+        os.path.expanduser("~"), ".cache", "pad_analytics", "metadata.sqlite"
+    )
+
+
+def enable_metadata_cache(path=None, ttls=None, max_bytes=MAX_BYTES, offline=False):
+    """Cache API metadata responses on disk from now on.
+
+    Parameters:
+        path (str, optional): SQLite file, ~/.cache/pad_analytics/metadata.sqlite
+            by default.
+        ttls (dict, optional): Seconds of freshness by endpoint ("cards",
+            "project_cards", "card_listings", "projects", "models",
+            "default").
+        max_bytes (int): Compressed bytes kept before eviction.
+        offline (bool): Only answer from the cache, never the network.
+
+    Returns:
+        MetadataCache: The active cache.
+    """
+    global _cache, _cache_checked
+    cache = MetadataCache(path or default_path(), ttls, max_bytes, offline)
+    with _cache_lock:
+        old, _cache, _cache_checked = _cache, cache, True
+    if old is not None:
+        old.close()
+    return cache
+
+
+def disable_metadata_cache():
+    """Go back to requesting every response from the API."""
+    global _cache, _cache_checked
+    with _cache_lock:
+        old, _cache, _cache_checked = _cache, None, True
+    if old is not None:
+        old.close()
+
+
+def set_offline(offline=True):
+    """Switch the active cache to or from offline mode."""
+    cache = get_cache()
+    if cache is None:
+        raise RuntimeError("The metadata cache is not enabled")
+    cache.offline = offline
+
+
+def get_cache():
+    """The active MetadataCache, or None when caching is off.
+
+    On first use the cache is enabled from PAD_METADATA_CACHE and
+    PAD_OFFLINE if they are set. Offline mode needs the cache, so
+    PAD_OFFLINE alone enables it at the default path.
+    """
+    global _cache_checked
+    if not _cache_checked:
+        setting = os.getenv("PAD_METADATA_CACHE", "")
+        offline = os.getenv("PAD_OFFLINE", "").lower() in ("1", "true", "yes")
+        if setting.lower() in ("", "0", "false", "no", "1", "true", "yes"):
+            path = None
+            enabled = setting.lower() in ("1", "true", "yes")
+        else:
+            path = setting
+            enabled = True
+        if enabled or offline:
+            enable_metadata_cache(path, offline=offline)
+        else:
+            _cache_checked = True
+    return _cache
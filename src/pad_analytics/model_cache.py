@@ -0,0 +1,214 @@
+"""Local, content-addressed cache of model weight files.
+
+Model files are downloaded once into a cache directory, PAD_MODEL_CACHE or
+~/.cache/pad_analytics/models by default, and stored under the SHA-256 of
+their content. manifest.json maps each model id to its URL, file, hash,
+type and labels, so later runs and other worker processes find the file
+without downloading it again.
+
+Downloads go to a temporary file in the cache directory and are moved into
+place with os.replace, under a lock file per URL, so parallel workers never
+see partial files or download the same model twice.
+"""
+
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import urllib.request
+from zipfile import ZipFile, BadZipFile
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+MANIFEST_FILE = "manifest.json"
+
+
+def cache_dir():
+    """The model cache directory, created if needed."""
+    path = os.getenv("PAD_MODEL_CACHE") or os.path.join(
+        os.path.expanduser("~"), ".cache", "pad_analytics", "models"
+    )
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+@contextlib.contextmanager
+def file_lock(name):
+    """Hold an exclusive lock on a lock file in the cache directory.
+
+    The lock is taken with flock (or msvcrt.locking on Windows), so it is
+    held against other processes as well as other threads.
+    """
+    path = os.path.join(cache_dir(), name + ".lock")
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def read_manifest():
+    """The manifest as a dict of model id (as str) -> entry."""
+    path = os.path.join(cache_dir(), MANIFEST_FILE)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _write_manifest(manifest):
+    directory = cache_dir()
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".json.tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(temp_path, os.path.join(directory, MANIFEST_FILE))
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(temp_path)
+        raise
+
+
+def update_manifest(model_id, **entry):
+    """Add or update the manifest entry of a model."""
+    with file_lock("manifest"):
+        manifest = read_manifest()
+        manifest.setdefault(str(model_id), {}).update(entry)
+        _write_manifest(manifest)
+        return manifest[str(model_id)]
+
+
+def cached_model(model_id, url=None):
+    """Path of a cached model file, or None if it is not cached.
+
+    An entry only counts if its file is still there with the recorded size
+    and, when url is given, it was downloaded from that URL.
+    """
+    entry = read_manifest().get(str(model_id))
+    if not entry or (url is not None and entry.get("url") != url):
+        return None
+    path = os.path.join(cache_dir(), entry["file"])
+    try:
+        if os.path.getsize(path) != entry.get("size"):
+            return None
+    except OSError:
+        return None
+    return path
+
+
+def download(url):
+    """Download url into the cache, stored under its SHA-256.
+
+    Returns:
+        tuple: (path, sha256, size) of the cached file.
+    """
+    directory = cache_dir()
+    extension = os.path.splitext(os.path.basename(url))[1]
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        sha = hashlib.sha256()
+        size = 0
+        with os.fdopen(fd, "wb") as f, urllib.request.urlopen(url) as response:
+            for block in iter(lambda: response.read(1 << 20), b""):
+                sha.update(block)
+                f.write(block)
+                size += len(block)
+        digest = sha.hexdigest()
+        path = os.path.join(directory, digest + extension)
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(temp_path)
+        raise
+    return path, digest, size
+
+
+def ensure_model(model_id, url, model_type=None, labels=None):
+    """Return the local path of a model file, downloading it if needed.
+
+    Cached files are used without any network access. Otherwise the file is
+    downloaded under a lock on its URL, so concurrent callers wait for one
+    download instead of racing.
+
+    Parameters:
+        model_id (int or str): Model id, the manifest key.
+        url (str): Weights URL of the model.
+        model_type (str, optional): Model type, e.g. "tf_lite", recorded in
+            the manifest.
+        labels (list, optional): Model labels recorded in the manifest.
+            Defaults to the labels.txt inside a TFLite model file.
+
+    Returns:
+        str: Path of the cached model file.
+    """
+    path = cached_model(model_id, url)
+    if path is not None:
+        return path
+
+    lock_name = hashlib.sha1(url.encode()).hexdigest()
+    with file_lock(lock_name):
+        # another worker may have finished the download meanwhile
+        path = cached_model(model_id, url)
+        if path is not None:
+            return path
+
+        path, digest, size = download(url)
+        if labels is None:
+            labels = read_labels(path)
+        update_manifest(
+            model_id,
+            id=str(model_id),
+            url=url,
+            file=os.path.basename(path),
+            sha256=digest,
+            size=size,
+            type=model_type,
+            labels=list(labels) if labels is not None else None,
+        )
+    return path
+
+
+def read_labels(model_file, label_file="labels.txt"):
+    """Labels stored in a TFLite model file, read in memory.
+
+    Returns:
+        list of str: One label per line, or None if the file has no labels.
+    """
+    try:
+        with ZipFile(model_file, "r") as zipObject:
+            with zipObject.open(label_file) as f:
+                text = io.TextIOWrapper(f).read()
+    except (BadZipFile, KeyError):
+        return None
+    return text.splitlines()
+
+
+def clear_model_cache():
+    """Delete every cached model file and the manifest."""
+    directory = cache_dir()
+    with file_lock("manifest"):
+        for name in os.listdir(directory):
+            if name.endswith(".lock"):
+                continue
+            path = os.path.join(directory, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.unlink(path)
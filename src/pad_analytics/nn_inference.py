@@ -0,0 +1,655 @@
+"""Shared TFLite interpreters for the neural network models.
+
+Creating a tf.lite.Interpreter and allocating its tensors costs far more than
+a single invoke, so interpreters are kept in a process-wide registry instead
+of being rebuilt for every card. The registry holds one InterpreterPool per
+model file, keyed by path and content hash, and evicts the least recently
+used models beyond MAX_CACHED_MODELS. Each pool hands out allocated
+interpreters to one thread at a time and keeps up to POOL_SIZE idle ones
+around for reuse.
+
+invoke_batch runs a whole batch of inputs per invoke when the model's batch
+dimension is dynamic, and falls back to chunks of single inputs otherwise.
+invoke_cards does the same for card images, preprocessing them directly into
+the interpreter's input tensor, and postprocess turns the outputs into
+predictions, probabilities and energies with NumPy. Quantized int8/uint8
+models get their inputs quantized and their outputs dequantized with the
+scale and zero point of the tensors.
+
+The interpreter class comes from the first installed backend in BACKENDS,
+imported on first use: the standalone tflite_runtime or LiteRT
+(ai_edge_litert) interpreters start much faster than full TensorFlow, which
+is only imported when neither is available. Set PAD_TFLITE_BACKEND to one of
+the BACKENDS names to pick one explicitly.
+
+Interpreters use NUM_THREADS threads (PAD_TFLITE_THREADS, or the backend
+default), or a per-model count from set_num_threads. suggest_thread_split
+divides the cores between worker processes and interpreter threads, and
+benchmark_threads, also run as
+
+    python -m pad_analytics.nn_inference model.tflite
+
+measures the throughput of each setting on a synthetic card.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import importlib
+import itertools
+import os
+import threading
+import time
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+# Number of models kept in the interpreter registry
+MAX_CACHED_MODELS = 8
+
+# Idle interpreters kept per model
+POOL_SIZE = 4
+
+# Inputs per invoke for models with a dynamic batch dimension
+BATCH_SIZE = 16
+
+
+def _threads_from_env():
+    """PAD_TFLITE_THREADS as a thread count, None if unset or invalid."""
+    setting = os.getenv("PAD_TFLITE_THREADS", "").strip()
+    if not setting:
+        return None
+    try:
+        return int(setting) or None
+    except ValueError:
+        warnings.warn(
+            f"Ignoring PAD_TFLITE_THREADS={setting!r}, expected a number of threads"
+        )
+        return None
+
+
+# Interpreter threads, None for the backend default
+NUM_THREADS = _threads_from_env()
+
+# Interpreter threads above which more threads rarely pay off for these models
+MAX_USEFUL_THREADS = 4
+
+# Active area of a card image (left, top, right, bottom) fed to the models
+CARD_CROP = (71, 359, 71 + 636, 359 + 490)
+
+# Interpreter backends, most lightweight first: name -> (module, attribute)
+BACKENDS = OrderedDict(
+    [
+        ("tflite_runtime", ("tflite_runtime.interpreter", "Interpreter")),
+        ("ai_edge_litert", ("ai_edge_litert.interpreter", "Interpreter")),
+        ("tensorflow", ("tensorflow", "lite.Interpreter")),
+    ]
+)
+
+_backend = None
+_backend_lock = threading.Lock()
+_registry = OrderedDict()
+_registry_lock = threading.Lock()
+_hash_cache = {}
+_model_threads = {}
+
+
+def file_hash(path):
+    """SHA-256 of a file, memoized on its path, modification time and size."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    digest = _hash_cache.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        digest = sha.hexdigest()
+        _hash_cache[key] = digest
+    return digest
+
+
+def _import_backend(name):
+    module_name, attribute = BACKENDS[name]
+    obj = importlib.import_module(module_name)
+    for part in attribute.split("."):
+        obj = getattr(obj, part)
+    return obj
+
+
+def set_backend(backend):
+    """Choose the interpreter backend.
+
+    Parameters:
+        backend (str, class or None): A BACKENDS name, an Interpreter class
+            taking model_path, or None to pick the first installed backend
+            again on next use.
+    """
+    global _backend
+    if isinstance(backend, str):
+        if backend not in BACKENDS:
+            raise ValueError(
+                f"Unknown TFLite backend {backend!r}, expected one of {list(BACKENDS)}"
+            )
+        backend = (backend, _import_backend(backend))
+    elif backend is not None:
+        backend = (getattr(backend, "__module__", "custom"), backend)
+    with _backend_lock:
+        _backend = backend
+    clear_interpreter_cache()
+
+
+def get_backend():
+    """Name and Interpreter class of the backend, importing it on first use.
+
+    Raises:
+        ImportError: If no backend is installed.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            names = list(BACKENDS)
+            requested = os.getenv("PAD_TFLITE_BACKEND")
+            if requested:
+                names = [requested]
+            for name in names:
+                try:
+                    _backend = (name, _import_backend(name))
+                    break
+                except (ImportError, AttributeError, KeyError):
+                    continue
+            else:
+                raise ImportError(
+                    "No TFLite interpreter found, install one of "
+                    "tflite-runtime, ai-edge-litert or tensorflow"
+                )
+        return _backend
+
+
+def set_num_threads(num_threads, model_path=None):
+    """Set the threads of new interpreters, for one model or for all.
+
+    Parameters:
+        num_threads (int or None): Threads per interpreter, None for the
+            backend default or, for one model, the global setting.
+        model_path (str, optional): The model to set it for; the global
+            NUM_THREADS if not given.
+    """
+    global NUM_THREADS
+    if model_path is None:
+        NUM_THREADS = num_threads
+    elif num_threads is None:
+        _model_threads.pop(os.path.abspath(model_path), None)
+    else:
+        _model_threads[os.path.abspath(model_path)] = num_threads
+
+
+def get_num_threads(model_path):
+    """Threads per interpreter of a model, None for the backend default."""
+    return _model_threads.get(os.path.abspath(model_path), NUM_THREADS)
+
+
+def suggest_thread_split(workers=None, cores=None):
+    """Split the available cores between worker processes and interpreter threads.
+
+    The PAD models are small enough that separate processes scale better
+    than more intra-op threads, so each interpreter gets at most
+    MAX_USEFUL_THREADS threads, about a quarter of the cores, and the rest
+    goes to workers.
+
+    Parameters:
+        workers (int, optional): Fixed number of worker processes; the
+            threads are then the cores left to each of them.
+        cores (int, optional): Cores to split, by default those this
+            process may run on.
+
+    Returns:
+        tuple: (workers, num_threads).
+    """
+    if cores is None:
+        try:
+            cores = len(os.sched_getaffinity(0))
+        except AttributeError:
+            cores = os.cpu_count() or 1
+    if workers is not None:
+        return workers, max(1, cores // workers)
+    num_threads = max(1, min(MAX_USEFUL_THREADS, cores // 4))
+    return max(1, cores // num_threads), num_threads
+
+
+def create_interpreter(model_path, num_threads=None):
+    """Create a TFLite interpreter for a model file and allocate its tensors."""
+    _, interpreter_class = get_backend()
+    if num_threads is None:
+        interpreter = interpreter_class(model_path=model_path)
+    else:
+        interpreter = interpreter_class(model_path=model_path, num_threads=num_threads)
+    interpreter.allocate_tensors()
+    return interpreter
+
+
+class InterpreterPool:
+    """Allocated interpreters of one model, reused across calls and threads.
+
+    Parameters:
+        model_path (str): Path to the .tflite model file.
+        max_size (int): Idle interpreters kept for reuse. More can be
+            borrowed at once; the extras are dropped when returned.
+        num_threads (int, optional): Threads per interpreter, None for the
+            backend default.
+    """
+
+    def __init__(self, model_path, max_size=POOL_SIZE, num_threads=None):
+        self.model_path = model_path
+        self.max_size = max_size
+        self.num_threads = num_threads
+        self._idle = []
+        self._lock = threading.Lock()
+
+        # the first interpreter gives the tensor details and stays in the pool
+        interpreter = create_interpreter(model_path, num_threads)
+        self.input_details = interpreter.get_input_details()
+        self.output_details = interpreter.get_output_details()
+        self._idle.append(interpreter)
+
+        # the model takes batches if its batch dimension is dynamic
+        signature = self.input_details[0].get("shape_signature")
+        self.batchable = signature is not None and signature[0] == -1
+
+    @property
+    def input_shape(self):
+        """Input (height, width, depth) of the model."""
+        return tuple(int(n) for n in self.input_details[0]["shape"][1:])
+
+    def acquire(self):
+        """Take an idle interpreter, or create one if none is free."""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return create_interpreter(self.model_path, self.num_threads)
+
+    def release(self, interpreter):
+        """Give an interpreter back to the pool."""
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append(interpreter)
+
+    @contextlib.contextmanager
+    def interpreter(self):
+        """Borrow an interpreter for the duration of a with block."""
+        interpreter = self.acquire()
+        try:
+            yield interpreter
+        finally:
+            self.release(interpreter)
+
+
+def set_batch_size(interpreter, batch_size):
+    """Resize the interpreter input to batch_size rows if it is not already."""
+    details = interpreter.get_input_details()[0]
+    if details["shape"][0] != batch_size:
+        shape = [batch_size] + list(details["shape"][1:])
+        interpreter.resize_tensor_input(details["index"], shape, strict=True)
+        interpreter.allocate_tensors()
+
+
+def fit_batch_size(pool, interpreter, batch_size):
+    """Resize the interpreter for batch_size inputs if the model allows it.
+
+    Returns:
+        int: The batch size the interpreter now takes, batch_size or 1.
+    """
+    if not pool.batchable:
+        batch_size = 1
+    try:
+        set_batch_size(interpreter, batch_size)
+    except (ValueError, RuntimeError):
+        # the model cannot be resized after all, feed single inputs
+        pool.batchable = False
+        batch_size = 1
+        set_batch_size(interpreter, batch_size)
+    return batch_size
+
+
+def _empty_outputs(pool):
+    details = pool.output_details[0]
+    shape = (0,) + tuple(details["shape"][1:])
+    return dequantize(np.zeros(shape, dtype=details["dtype"]), details["quantization"])
+
+
+def invoke_batch(pool, inputs, batch_size=BATCH_SIZE):
+    """Run a batch of model inputs and return the first model output.
+
+    Models with a dynamic batch dimension get up to batch_size inputs per
+    invoke; if resizing fails, or the batch dimension is fixed, the inputs
+    are fed one at a time.
+
+    Parameters:
+        pool (InterpreterPool): The model to run.
+        inputs (array-like): (B, height, width, depth) preprocessed inputs,
+            as real values; they are quantized for int8/uint8 models.
+        batch_size (int): Inputs per invoke for batchable models.
+
+    Returns:
+        np.ndarray: (B, ...) model outputs, dequantized to float32 for
+        quantized models.
+    """
+    details = pool.input_details[0]
+    if np.issubdtype(details["dtype"], np.integer):
+        inputs = quantize(inputs, details["dtype"], details["quantization"])
+    else:
+        inputs = np.asarray(inputs, dtype=details["dtype"])
+    input_index = details["index"]
+    output_index = pool.output_details[0]["index"]
+    quantization = pool.output_details[0]["quantization"]
+    outputs = []
+    with pool.interpreter() as interpreter:
+        start = 0
+        while start < len(inputs):
+            step = min(batch_size, len(inputs) - start)
+            step = fit_batch_size(pool, interpreter, step)
+            interpreter.set_tensor(input_index, inputs[start : start + step])
+            interpreter.invoke()
+            outputs.append(
+                dequantize(interpreter.get_tensor(output_index), quantization)
+            )
+            start += step
+    if not outputs:
+        return _empty_outputs(pool)
+    return np.concatenate(outputs)
+
+
+def invoke_cards(pool, images, batch_size=BATCH_SIZE):
+    """Run PIL card images through the model and return the first output.
+
+    Each card is cropped and resized straight into the interpreter's own
+    input tensor, so no per-card or whole-batch input arrays are built.
+    images can be any iterable; only batch_size cards are open at a time.
+
+    Parameters:
+        pool (InterpreterPool): The model to run.
+        images (iterable): PIL card images.
+        batch_size (int): Cards per invoke for batchable models.
+
+    Returns:
+        np.ndarray: (B, ...) model outputs, dequantized to float32 for
+        quantized models.
+    """
+    height, width, _ = pool.input_shape
+    input_index = pool.input_details[0]["index"]
+    input_quantization = pool.input_details[0]["quantization"]
+    output_index = pool.output_details[0]["index"]
+    quantization = pool.output_details[0]["quantization"]
+    images = iter(images)
+    pending = []
+    outputs = []
+    with pool.interpreter() as interpreter:
+        while True:
+            wanted = batch_size if pool.batchable else 1
+            pending.extend(itertools.islice(images, max(0, wanted - len(pending))))
+            if not pending:
+                break
+            step = fit_batch_size(pool, interpreter, len(pending))
+
+            # the view must be gone before invoke, which checks for references
+            buffer = interpreter.tensor(input_index)()
+            for i, img in enumerate(pending[:step]):
+                card_input(img, (width, height), buffer[i], input_quantization)
+            del buffer
+
+            interpreter.invoke()
+            outputs.append(
+                dequantize(interpreter.get_tensor(output_index), quantization)
+            )
+            del pending[:step]
+    if not outputs:
+        return _empty_outputs(pool)
+    return np.concatenate(outputs)
+
+
+def card_input(img, size=(454, 454), out=None, quantization=None):
+    """Crop the active area of a PIL card image and resize it for a model.
+
+    The crop and bicubic resize are the same PIL calls as always, so inputs
+    are identical to before; only the final cast writes into out.
+
+    Parameters:
+        img (PIL.Image): The card image.
+        size (tuple): Model input (width, height).
+        out (np.ndarray, optional): (height, width, 3) array to fill, e.g.
+            a row of a batch or of the interpreter input tensor.
+        quantization (tuple, optional): (scale, zero_point) of an integer
+            out, applied to the pixel values as in quantize.
+
+    Returns:
+        np.ndarray: out, or a new (height, width, 3) float32 array.
+    """
+    img = img.crop(CARD_CROP).resize(size, Image.BICUBIC)
+    if out is None:
+        out = np.empty((size[1], size[0], 3), dtype=np.float32)
+    pixels = np.asarray(img)
+    if quantization is not None and np.issubdtype(out.dtype, np.integer):
+        pixels = quantize(pixels, out.dtype, quantization)
+    out[...] = pixels
+    return out
+
+
+def _is_identity(quantization):
+    scale, zero_point = quantization
+    return scale == 0 or (scale == 1 and zero_point == 0)
+
+
+def quantize(values, dtype, quantization):
+    """Convert real values to a quantized integer tensor dtype.
+
+    Parameters:
+        values (array-like): Real values, e.g. 0-255 pixel values.
+        dtype: Integer dtype of the tensor, np.int8 or np.uint8.
+        quantization (tuple): (scale, zero_point) from the tensor details;
+            a scale of 0 means the tensor is not quantized.
+
+    Returns:
+        np.ndarray: round(values / scale + zero_point), clipped to dtype.
+    """
+    values = np.asarray(values)
+    limits = np.iinfo(dtype)
+    if _is_identity(quantization):
+        if values.dtype == dtype:
+            return values
+        return np.clip(values, limits.min, limits.max).astype(dtype)
+    scale, zero_point = quantization
+    scaled = np.round(values / np.float32(scale)) + zero_point
+    return np.clip(scaled, limits.min, limits.max).astype(dtype)
+
+
+def dequantize(values, quantization):
+    """Real values of a quantized tensor, (values - zero_point) * scale.
+
+    Float tensors, with a scale of 0, are returned unchanged.
+    """
+    values = np.asarray(values)
+    if not np.issubdtype(values.dtype, np.integer) or quantization[0] == 0:
+        return values
+    scale, zero_point = quantization
+    return (values.astype(np.float32) - zero_point) * np.float32(scale)
+
+
+def softmax(logits, axis=-1):
+    """Numerically stable softmax of a batch of logits."""
+    logits = np.asarray(logits, dtype=np.float64)
+    exps = np.exp(logits - np.max(logits, axis=axis, keepdims=True))
+    return exps / np.sum(exps, axis=axis, keepdims=True)
+
+
+def logsumexp(logits, axis=-1):
+    """Numerically stable log(sum(exp(logits))), the energy of an output."""
+    logits = np.asarray(logits, dtype=np.float64)
+    peak = np.max(logits, axis=axis, keepdims=True)
+    sums = np.sum(np.exp(logits - peak), axis=axis, keepdims=True)
+    return np.squeeze(peak + np.log(sums), axis=axis)
+
+
+def is_softmaxed(outputs, axis=-1):
+    """Whether outputs already sum to one (within 0.99 and 1.01)."""
+    sums = np.sum(outputs, axis=axis)
+    return (sums >= 0.99) & (sums <= 1.01)
+
+
+def probabilities(outputs, axis=-1):
+    """Class probabilities of model outputs.
+
+    Outputs that already sum to one are taken as probabilities, anything
+    else as logits, like pad_neural_network.catagorize has always done.
+    """
+    outputs = np.asarray(outputs, dtype=np.float64)
+    softmaxed = np.expand_dims(is_softmaxed(outputs, axis), axis)
+    return np.where(softmaxed, outputs, softmax(outputs, axis))
+
+
+def top_k(scores, k=1):
+    """Indices and values of the k highest scores of each row, best first."""
+    scores = np.asarray(scores)
+    k = min(k, scores.shape[-1])
+    indices = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    values = np.take_along_axis(scores, indices, axis=-1)
+    order = np.argsort(-values, axis=-1, kind="stable")
+    return (
+        np.take_along_axis(indices, order, axis=-1),
+        np.take_along_axis(values, order, axis=-1),
+    )
+
+
+def postprocess(outputs):
+    """Best class, its probability and the energy of each model output.
+
+    Parameters:
+        outputs (array-like): (B, n_classes) model outputs.
+
+    Returns:
+        tuple: (indices, probabilities, energies), three (B,) arrays. The
+        energy is the logsumexp of the raw outputs.
+    """
+    outputs = np.asarray(outputs, dtype=np.float64)
+    best = np.argmax(outputs, axis=-1)
+    probs = np.take_along_axis(probabilities(outputs), best[..., None], axis=-1)
+    return best, probs[..., 0], logsumexp(outputs)
+
+
+def get_interpreter_pool(model_path):
+    """Return the shared InterpreterPool of a model file.
+
+    Pools are keyed by the absolute path and the SHA-256 of the file, so a
+    replaced model file gets fresh interpreters, and by the model's thread
+    count, so a new set_num_threads setting takes effect on the next call.
+    """
+    path = os.path.abspath(model_path)
+    num_threads = get_num_threads(path)
+    key = (path, file_hash(path), num_threads)
+    with _registry_lock:
+        pool = _registry.get(key)
+        if pool is not None:
+            _registry.move_to_end(key)
+            return pool
+
+    pool = InterpreterPool(path, num_threads=num_threads)
+
+    with _registry_lock:
+        # another thread may have built the same pool meanwhile
+        pool = _registry.setdefault(key, pool)
+        _registry.move_to_end(key)
+        for stale in [k for k in _registry if k[0] == path and k != key]:
+            del _registry[stale]
+        while len(_registry) > MAX_CACHED_MODELS:
+            _registry.popitem(last=False)
+    return pool
+
+
+def clear_interpreter_cache():
+    """Drop every pooled interpreter."""
+    with _registry_lock:
+        _registry.clear()
+
+
+def synthetic_card(seed=0, shape=(1250, 730, 3)):
+    """Random PIL image with the size of a card photo, for benchmarks."""
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, shape, dtype=np.uint8))
+
+
+def benchmark_threads(model_path, thread_counts=None, batch_sizes=None, cards=32):
+    """Measure model throughput for interpreter thread counts and batch sizes.
+
+    Every setting runs the same synthetic cards on its own interpreter,
+    after one warm-up invoke.
+
+    Parameters:
+        model_path (str): Path to the .tflite model file.
+        thread_counts (list, optional): Threads to try, by default 1, 2, 4,
+            ... up to the available cores.
+        batch_sizes (list, optional): Cards per invoke to try, by default 1
+            and BATCH_SIZE; only 1 for models without a dynamic batch.
+        cards (int): Cards per measurement.
+
+    Returns:
+        pd.DataFrame: One row per setting with num_threads, batch_size,
+        seconds and cards_per_s.
+    """
+    import pandas as pd
+
+    if thread_counts is None:
+        _, cores = suggest_thread_split(workers=1)
+        thread_counts = [1]
+        while thread_counts[-1] * 2 <= cores:
+            thread_counts.append(thread_counts[-1] * 2)
+    if batch_sizes is None:
+        batch_sizes = [1, BATCH_SIZE]
+    images = [synthetic_card(seed) for seed in range(cards)]
+
+    rows = []
+    for num_threads in thread_counts:
+        pool = InterpreterPool(os.path.abspath(model_path), 1, num_threads=num_threads)
+        for batch_size in batch_sizes:
+            if batch_size > 1 and not pool.batchable:
+                continue
+            invoke_cards(pool, images[:batch_size], batch_size)
+            start = time.perf_counter()
+            invoke_cards(pool, images, batch_size)
+            seconds = time.perf_counter() - start
+            rows.append(
+                {
+                    "num_threads": num_threads,
+                    "batch_size": batch_size,
+                    "seconds": seconds,
+                    "cards_per_s": cards / seconds,
+                }
+            )
+    return pd.DataFrame(
+        rows, columns=["num_threads", "batch_size", "seconds", "cards_per_s"]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark a TFLite model for interpreter threads and batch sizes."
+    )
+    parser.add_argument("model", help="path to the .tflite model file")
+    parser.add_argument("--threads", type=int, nargs="+", help="thread counts to try")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", help="batch sizes to try")
+    parser.add_argument("--cards", type=int, default=32, help="cards per measurement")
+    args = parser.parse_args()
+
+    workers, num_threads = suggest_thread_split()
+    print(f"Backend: {get_backend()[0]}")
+    print(f"Suggested split: {workers} workers x {num_threads} threads")
+    print(
+        benchmark_threads(
+            args.model, args.threads, args.batch_sizes, args.cards
+        ).to_string(index=False)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,18 +3,25 @@ import urllib3
 import warnings
 import sys
 import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageFile
 import ipywidgets as widgets
 from IPython.display import display, HTML
 from io import BytesIO
 import io
 import pandas as pd
-import tensorflow as tf
 from sklearn.metrics import mean_squared_error
 import tempfile
+import time
 
 from . import regionRoutine
 from . import pad_helper
+from . import pls_model
+from . import nn_inference
+from . import model_cache
+from . import http_client
+from . import metadata_cache
 import numpy as np
 import csv
 import cv2 as cv
@@ -70,6 +77,10 @@ def suppress_stderr():
 
 
 API_URL = "https://pad.crc.nd.edu/api/v2"
+API_LD_URL = "https://pad.crc.nd.edu/api-ld/v3"
+
+# Concurrent API requests of multi-request lookups, e.g. get_project_cards
+MAX_WORKERS = 8
 
 
 def _get_mapping_file_path():
@@ -107,19 +118,30 @@ def _get_mapping_file_path():
 MODEL_DATASET_MAPPING = _get_mapping_file_path()
 
 
-def get_data_api(request_url, data_type=""):
+def _get_json(request_url, timeout=None):
+    # timeout in seconds, the shared client's default if None
+    kwargs = {} if timeout is None else {"timeout": timeout}
+    cache = metadata_cache.get_cache()
+    if cache is not None:
+        # cached response, revalidated with the API when stale
+        return cache.get_json(request_url, verify=False, **kwargs)
+    # fetch_data_from_api
+    r = http_client.get(
+        request_url, verify=False, **kwargs
+    )  # NOTE: Using verify=False due to a SSL issue, I need a valid certificate, then I will remove this parameter.
+    r.raise_for_status()  # Raise an exception if the status is not 200
+    return r.json()
+
+
+def get_data_api(request_url, data_type="", timeout=None):
     try:
-        # fetch_data_from_api
-        r = requests.get(
-            url=request_url, verify=False
-        )  # NOTE: Using verify=False due to a SSL issue, I need a valid certificate, then I will remove this parameter.
-        r.raise_for_status()  # Raise an exception if the status is not 200
-        data = r.json()
+        data = _get_json(request_url, timeout)
         df = pd.json_normalize(data)
         return df
     except requests.exceptions.RequestException as e:
         print(e)
-        print(f"Error accessing {data_type} data: {r.status_code}")
+        status_code = getattr(e.response, "status_code", None)
+        print(f"Error accessing {data_type} data: {status_code}")
         return None
 
 
@@ -173,7 +195,24 @@ def get_projects():
 
 
 # Extended function to get project cards for either a single project ID or multiple project IDs
-def get_project_cards(project_name=None, project_ids=None):
+def get_project_cards(
+    project_name=None, project_ids=None, max_workers=MAX_WORKERS, timeout=None
+):
+    """
+    Get the cards of one or more projects.
+
+    The projects are requested concurrently, at most max_workers at a time,
+    and their cards are concatenated in the order of project_ids.
+
+    Parameters:
+        project_name (str, optional): Name of a single project.
+        project_ids (int or list, optional): Project ids, all projects if None.
+        max_workers (int): Most project requests in flight at once.
+        timeout (float, optional): Seconds to wait for each request.
+
+    Returns:
+        pd.DataFrame: The cards, or None if no data was retrieved.
+    """
 
     def _get_project_cards_by_name(name):
         project_id = get_project(name=project_name).id.values[0]
@@ -186,7 +225,7 @@ def get_project_cards(project_name=None, project_ids=None):
     # Get project cards
     def _get_project_cards_by_id(project_id):
         request_url = f"{API_URL}/projects/{project_id}/cards"
-        return get_data_api(request_url, f"project {project_id} cards")
+        return get_data_api(request_url, f"project {project_id} cards", timeout)
 
     # check if project_name is not None
     if project_name is not None:
@@ -205,14 +244,13 @@ def get_project_cards(project_name=None, project_ids=None):
             "project_ids must be a single integer, a list of integers, or None"
         )
 
-    all_cards = []  # List to hold dataframes from multiple projects
+    # Get cards for each project, concurrently; map keeps the order of project_ids
+    workers = max(1, min(max_workers, len(project_ids)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_get_project_cards_by_id, project_ids))
 
-    for project_id in project_ids:
-        # Get cards for each project
-        project_cards = _get_project_cards_by_id(project_id)
-
-        if project_cards is not None:
-            all_cards.append(project_cards)
+    # List to hold dataframes from multiple projects
+    all_cards = [cards for cards in results if cards is not None]
 
     # Concatenate all dataframes into one, if there is data
     if all_cards:
@@ -245,6 +283,76 @@ def get_card(card_id=None, sample_id=None):
         raise ValueError("You must provide either card_id or sample_id")
 
 
+# Column types of get_cards, for the columns present in the responses
+CARD_COLUMN_TYPES = {
+    "id": "Int64",
+    "sample_id": "Int64",
+    "quantity": "float64",
+    "project.id": "Int64",
+    "deleted": "boolean",
+    "date_of_creation": "datetime",  # UTC timestamps
+}
+
+
+def get_cards(card_ids, max_workers=MAX_WORKERS, timeout=None):
+    """
+    Get many cards by id in one DataFrame.
+
+    The cards are requested concurrently, at most max_workers at a time, and
+    all responses are normalized together into one DataFrame with the
+    column types of CARD_COLUMN_TYPES. Repeated ids are fetched once.
+
+    Parameters:
+        card_ids (list): Card ids.
+        max_workers (int): Most card requests in flight at once.
+        timeout (float, optional): Seconds to wait for each request.
+
+    Returns:
+        tuple: (cards, failures), the DataFrame of the cards retrieved, in the
+            order of card_ids, and a DataFrame with the id, status_code and
+            error of each card that could not be retrieved.
+    """
+    card_ids = list(dict.fromkeys(card_ids))
+
+    def _fetch(card_id):
+        try:
+            return _get_json(f"{API_URL}/cards/{card_id}", timeout), None
+        except (requests.exceptions.RequestException, ValueError) as e:
+            return None, e
+
+    workers = max(1, min(max_workers, len(card_ids)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_fetch, card_ids))
+
+    records = []
+    failures = []
+    for card_id, (data, error) in zip(card_ids, results):
+        if error is None:
+            records.append(data)
+        else:
+            response = getattr(error, "response", None)
+            status_code = getattr(response, "status_code", None)
+            failures.append(
+                {"id": card_id, "status_code": status_code, "error": str(error)}
+            )
+
+    # one normalization pass over all the cards
+    cards = pd.json_normalize(records)
+    for column, dtype in CARD_COLUMN_TYPES.items():
+        if column not in cards.columns:
+            continue
+        if dtype == "datetime":
+            cards[column] = pd.to_datetime(cards[column], errors="coerce", utc=True)
+        elif dtype == "boolean":
+            cards[column] = cards[column].astype("boolean")
+        else:
+            cards[column] = pd.to_numeric(cards[column], errors="coerce").astype(dtype)
+
+    failures = pd.DataFrame(failures, columns=["id", "status_code", "error"])
+    failures["status_code"] = failures["status_code"].astype("Int64")
+    return cards, failures
+
+
 def get_project_by_id(project_id):
     request_url = f"{API_URL}/projects/{project_id}"
     return get_data_api(request_url, f"project {project_id}")
@@ -271,7 +379,7 @@ def get_project(id=None, name=None):
 
 # Function to load image from URL
 def load_image_from_url(image_url):
-    response = requests.get(image_url)
+    response = http_client.get(image_url)
     img = Image.open(io.BytesIO(response.content))
     return img
 
@@ -539,7 +647,7 @@ def show_grouped_cards(df, group_column, images_per_row=5):
 
 
 def create_thumbnail(url, size=(100, 100)):
-    response = requests.get(url)
+    response = http_client.get(url)
     img = Image.open(BytesIO(response.content))
     img.thumbnail(size)
     return img
@@ -567,9 +675,16 @@ def get_card_by_sample_id(sample_id):
     """
 
     # Make API request
-    url = f"https://pad.crc.nd.edu/api-ld/v3/cards/by-sample/{sample_id}"
-    response = requests.get(url)
-    data = response.json()
+    url = f"{API_LD_URL}/cards/by-sample/{sample_id}"
+    cache = metadata_cache.get_cache()
+    if cache is not None:
+        # failed lookups are not cached, a sample may get cards later
+        data = cache.get_json(
+            url, validate=lambda data: data.get("success"), check_status=False
+        )
+    else:
+        response = http_client.get(url)
+        data = response.json()
 
     if not data["success"]:
         raise Exception(f"API request failed: {data['error']}")
@@ -769,9 +884,85 @@ def get_model(nn_id):
     return get_data_api(request_url, f"neural_network {nn_id}")
 
 
+# Card and model metadata memoized by metadata_session, None when inactive
+_metadata_memo = None
+_metadata_memo_depth = 0
+_metadata_memo_lock = threading.Lock()
+
+
+def enable_metadata_memo():
+    """
+    Memoize card and model lookups of predict, show_prediction and
+    preload_models for the rest of the session, until disable_metadata_memo.
+    """
+    global _metadata_memo
+    with _metadata_memo_lock:
+        if _metadata_memo is None:
+            _metadata_memo = {}
+
+
+def disable_metadata_memo():
+    """Stop memoizing card and model lookups and forget the memoized ones."""
+    global _metadata_memo, _metadata_memo_depth
+    with _metadata_memo_lock:
+        _metadata_memo = None
+        _metadata_memo_depth = 0
+
+
+@contextlib.contextmanager
+def metadata_session():
+    """
+    Memoize card and model lookups inside a with block.
+
+    Every card and model is fetched at most once in the block, however many
+    predictions use it. Nested blocks share the outer memo, and a memo
+    enabled with enable_metadata_memo is left in place.
+    """
+    global _metadata_memo, _metadata_memo_depth
+    with _metadata_memo_lock:
+        owner = _metadata_memo is None
+        if owner:
+            _metadata_memo = {}
+            _metadata_memo_depth = 1
+        elif _metadata_memo_depth:
+            _metadata_memo_depth += 1
+    try:
+        yield
+    finally:
+        with _metadata_memo_lock:
+            if _metadata_memo_depth:
+                _metadata_memo_depth -= 1
+                if _metadata_memo_depth == 0:
+                    _metadata_memo = None
+
+
+def _memoized(kind, key, fetch):
+    memo = _metadata_memo
+    if memo is None:
+        return fetch(key)
+    with _metadata_memo_lock:
+        if (kind, key) in memo:
+            return memo[(kind, key)]
+    value = fetch(key)
+    if value is not None:
+        with _metadata_memo_lock:
+            memo[(kind, key)] = value
+    return value
+
+
+def memoized_card(card_id):
+    """get_card, memoized inside a metadata_session."""
+    return _memoized("card", card_id, get_card)
+
+
+def memoized_model(model_id):
+    """get_model, memoized inside a metadata_session."""
+    return _memoized("model", model_id, get_model)
+
+
 def read_img(image_url):
     # Get the image data from the URL
-    response = requests.get(image_url)
+    response = http_client.get(image_url)
     response.raise_for_status()  # Ensure the request was successful
 
     # Open the image using PIL directly from the HTTP response
@@ -782,21 +973,22 @@ def read_img(image_url):
 def download_file(url, filename, images_path):
     """Download a file from a URL and save it to a local file."""
     try:
-        response = requests.get(url, stream=True, verify=False)
-        if response.status_code == 200:
-            path = os.path.join(images_path, filename)
-            with open(path, "wb") as f:
-                for chunk in response.iter_content(1024):
-                    f.write(chunk)
-            # print(f"File '{filename}' successfully downloaded to '{images_path}'")
-        else:
-            # Log error if the response status code is not 200
-            print(
-                f"Failed to download the file. URL: {url} returned status code: {response.status_code}"
-            )
-            raise Exception(
-                f"Failed to download the file. URL: {url} returned status code: {response.status_code}"
-            )
+        # closing the response returns its connection to the pool
+        with http_client.get(url, stream=True, verify=False) as response:
+            if response.status_code == 200:
+                path = os.path.join(images_path, filename)
+                with open(path, "wb") as f:
+                    for chunk in response.iter_content(1024):
+                        f.write(chunk)
+                # print(f"File '{filename}' successfully downloaded to '{images_path}'")
+            else:
+                # Log error if the response status code is not 200
+                print(
+                    f"Failed to download the file. URL: {url} returned status code: {response.status_code}"
+                )
+                raise Exception(
+                    f"Failed to download the file. URL: {url} returned status code: {response.status_code}"
+                )
     except Exception as e:
         # Log any other exceptions during the download process
         print(f"An error occurred while downloading the file: {e}")
@@ -813,70 +1005,96 @@ class pls:
     def __init__(self, coefficients_file):
         try:
             # load coeffs
-            self.coeff = {}
-            with open(coefficients_file) as csvcoeffs:
-                csvcoeffreader = csv.reader(csvcoeffs)
-                # i=0
-                for row in csvcoeffreader:
-                    elmts = []
-                    for j in range(1, len(row)):
-                        elmts.append(float(row[j]))
-                    self.coeff[row[0]] = elmts
+            self.model = pls_model.load_pls_model(coefficients_file)
         except Exception as e:
+            self.model = pls_model.PLSModel([], np.zeros((0, 361)))
             print("Error", e, "loading pls coefficients", coefficients_file)
 
+    # drug -> [offset, coefficients...], as listed in the coefficients file
+    @property
+    def coeff(self):
+        return dict(zip(self.model.drugs, self.model.coefficients.tolist()))
+
+    def features(self, in_file):
+        # grab image
+        img = cv.imread(in_file)
+
+        if img is None:
+            print("Converting img.. ", in_file)
+            # read image using Pillow and covert to cv2
+            img_pil = Image.open(in_file)
+            img = convert_from_image_to_cv2(img_pil)
+
+        if img is None:
+            raise Exception(f"Failed to load the file. URL: {in_file}.")
+
+        # pls features, in coefficient order
+        return regionRoutine.extractFeatureVector(img, True, 10)
+
     def quantity(self, in_file, drug):
         try:
-            # grab image
-            img = cv.imread(in_file)
-
-            if img is None:
-                print("Converting img.. ", in_file)
-                # read image using Pillow and covert to cv2
-                img_pil = Image.open(in_file)
-                img = convert_from_image_to_cv2(img_pil)
-
-            if img is None:
-                raise Exception(f"Failed to load the file. URL: {in_file}.")
-
-            # pls dictionary
-            f = {}
-            f = regionRoutine.fullRoutine(
-                img, regionRoutine.intFind.findMaxIntensitiesFiltered, f, True, 10
-            )
+            features = self.features(in_file)
 
             # drug?
             # continue if no coefficients
 
-            if drug.lower() not in self.coeff:
+            if drug.lower() not in self.model:
                 print(drug.lower(), "--- NOT IN COEFFICIENTS FILE ---")
                 return -1
 
-            drug_coeff = self.coeff[drug.lower()]  # coeff['amoxicillin'] #
-
-            # start with offst
-            pls_concentration = drug_coeff[0]
-
-            coeff_index = 1
-
-            for letter in ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L"]:
-                for region in range(10):
-                    for color_letter in ["R", "G", "B"]:
-                        pixval = f[letter + str(region + 1) + "-" + color_letter]
-                        pls_concentration += float(pixval) * drug_coeff[coeff_index]
-                        coeff_index += 1
-
             # print(drug.lower(), "--- OK ---")
-            return pls_concentration
+            return float(self.model.score(features, drug.lower()))
 
         except Exception as e:
             print("Error", e, "pls analyzing image", in_file, "with", drug)
             return -1.0
 
+    def quantities(self, in_file, drugs=None):
+        """
+        Predicts the concentration of several drugs from one card image with a
+        single matrix multiply, e.g. when the API of the sample is unknown.
+
+        Parameters:
+            in_file (str): Path to the card image.
+            drugs (list of str, optional): Drugs to score. Defaults to every
+                drug in the coefficients file.
+
+        Returns:
+            dict: Drug name -> concentration. Drugs not in the coefficients
+            file are left out.
+        """
+        try:
+            features = self.features(in_file)
+            if drugs is None:
+                drugs = self.model.drugs
+            drugs = [drug.lower() for drug in drugs if drug.lower() in self.model]
+            return dict(zip(drugs, self.model.score(features, drugs).tolist()))
+        except Exception as e:
+            print("Error", e, "pls analyzing image", in_file)
+            return {}
+
+    def quantities_from_features(self, features, drugs=None, drug_column="Contains"):
+        """
+        Predicts concentrations from stored features instead of card images,
+        e.g. to re-score the A1-R ... L10-B columns of a 10 region RGB CSV.
+
+        Parameters:
+            features: DataFrame with the feature columns, (B, 360) array or
+                memory-mapped array, or the path of a .npy file.
+            drugs (array-like of str, optional): Drug of each row. Defaults
+                to the drug_column of a DataFrame.
+            drug_column (str): Column holding the drug names.
+
+        Returns:
+            pd.Series or np.ndarray: One concentration per row, NaN where the
+            drug is not in the coefficients file.
+        """
+        return pls_model.score_feature_table(self.model, features, drugs, drug_column)
+
 
 def read_img(image_url):
     # Get the image data from the URL
-    response = requests.get(image_url)
+    response = http_client.get(image_url)
     response.raise_for_status()  # Ensure the request was successful
 
     # Open the image using PIL directly from the HTTP response
@@ -889,86 +1107,77 @@ def nn_predict(image_url, model_path, labels):
     # Read the image from the URL
     img = read_img(image_url)
 
-    # crop image to get active area
-    img = img.crop((71, 359, 71 + 636, 359 + 490))
-
-    # for square images
-    size = (454, 454)
-    img = img.resize((size), Image.BICUBIC)  # , Image.ANTIALIAS)
+    # Get the shared, already allocated interpreters of the model
+    pool = nn_inference.get_interpreter_pool(model_path)
 
-    # reshape the image as numpy
-    # im = np.asarray(img).flatten().reshape(1, HEIGHT_INPUT, WIDTH_INPUT, DEPTH)
+    # crop the active area into the model input and predict
+    result = nn_inference.invoke_cards(pool, [img])
 
-    HEIGHT_INPUT, WIDTH_INPUT, DEPTH = (454, 454, 3)
-
-    # reshape the image as numpy
-    im = (
-        np.asarray(img)
-        .flatten()
-        .reshape(1, HEIGHT_INPUT, WIDTH_INPUT, DEPTH)
-        .astype(np.float32)
-    )
+    num_labels, probabilities, energies = nn_inference.postprocess(result)
+    prediction = labels[num_labels[0]]
+    # print("Prediction: ", prediction)
 
-    # Load the TFLite model and allocate tensors.
-    # model_file = 'lite_models/' + arch + experiment + '_v1p0'
+    return prediction, probabilities[0], energies[0]
 
-    interpreter = tf.lite.Interpreter(model_path=model_path)
-    interpreter.allocate_tensors()
 
-    # Get input and output tensors.
-    input_details = interpreter.get_input_details()
-    output_details = interpreter.get_output_details()
-    # print("input", input_details[0])
+def nn_predict_batch(images, model_path, labels, batch_size=nn_inference.BATCH_SIZE):
+    """
+    Predict the labels of many cards with a TFLite model.
 
-    # Test the model on random input data.
-    input_shape = input_details[0]["shape"]
-    # input_data = np.array(np.random.random_sample(input_shape), dtype=np.float32)
-    interpreter.set_tensor(input_details[0]["index"], im)
+    Models with a dynamic batch dimension run batch_size cards per invoke,
+    other models run the cards one at a time on the same interpreter.
 
-    # predict
-    interpreter.invoke()
+    Parameters:
+        images (iterable): Card image URLs or PIL images.
+        model_path (str): Path to the .tflite model file.
+        labels (list): Label of each model output.
+        batch_size (int): Cards per invoke.
 
-    # result
-    result = interpreter.get_tensor(output_details[0]["index"])
+    Returns:
+        tuple: (predictions, probabilities, energies), a list of labels and
+        two float arrays with one entry per card, as from nn_predict.
+    """
+    # images are read one batch at a time, as the interpreter needs them
+    images = (read_img(img) if isinstance(img, str) else img for img in images)
 
-    num_label = np.argmax(result[0])
-    prediction = labels[num_label]
-    # print("Prediction: ", prediction)
+    pool = nn_inference.get_interpreter_pool(model_path)
+    results = nn_inference.invoke_cards(pool, images, batch_size)
 
-    probability = tf.nn.softmax(result[0])[num_label].numpy()
-    # print("Probability: ", probability)
+    num_labels, probabilities, energies = nn_inference.postprocess(results)
+    predictions = [labels[n] for n in num_labels]
+    return predictions, probabilities, energies
 
-    # energy
-    energy = tf.reduce_logsumexp(result[0], -1)
-    # print("Energy: ", energy.numpy())
 
-    return prediction, probability, energy.numpy()
+def predict(card_id, model_id, actual_api=None, verbose=False):
+    card_df = memoized_card(card_id)
+    model_df = memoized_model(model_id)
+    return _predict(card_df, model_df, model_id, actual_api, verbose)
 
 
-def predict(card_id, model_id, actual_api=None, verbose=False):
+def _predict(card_df, model_df, model_id, actual_api=None, verbose=False):
+    """predict with the card and model metadata already fetched."""
 
     pad_url = "https://pad.crc.nd.edu/"
 
-    card_df = get_card(card_id)
-
     # download model
-    model_df = get_model(model_id)
     model_type = model_df.type.values[0]
     model_url = model_df.weights_url.values[0]
-    model_file = os.path.basename(model_url)
+
+    # label type
+    labels = model_df.labels[0]
+
+    # local copy from the model cache, downloaded on first use
+    try:
+        model_file = model_cache.ensure_model(model_id, model_url, model_type, labels)
+    except Exception as e:
+        print(model_url, "failed to download.", e)
+        model_file = os.path.join(model_cache.cache_dir(), os.path.basename(model_url))
+
     if verbose:
         print(f"Model Type: {model_type}")
         print(f"Model URL: {model_url}")
         print(f"Model File: {model_file}")
 
-    if not os.path.exists(model_file):
-        if pad_helper.pad_download(model_url):
-            print(model_url, "downloaded.")
-        else:
-            print(model_url, "failed to download.")
-
-    # label type
-    labels = model_df.labels[0]
     try:  # Predict Concentration
         labels = list(map(int, labels))
         labels_type = "concentration"
@@ -989,7 +1198,7 @@ def predict(card_id, model_id, actual_api=None, verbose=False):
         actual_label = actual_api
 
     # fix label names
-    labels = list(map(standardize_names, get_model(model_id).labels.values[0]))
+    labels = list(map(standardize_names, model_df.labels.values[0]))
 
     # fix image url
     image_url = pad_url + card_df.processed_file_location.values[0]
@@ -1018,8 +1227,77 @@ def predict(card_id, model_id, actual_api=None, verbose=False):
     return actual_label, prediction
 
 
+def preload_models(model_ids, verbose=False):
+    """
+    Warm up models before the first prediction.
+
+    For each model this fetches its metadata, makes sure the weights are in
+    the local model cache, builds the shared interpreters (TFLite) or
+    coefficient matrix (PLS) and runs one dummy prediction, so later calls to
+    predict only pay for the prediction itself.
+
+    Parameters:
+        model_ids (list): Model ids, as for get_model.
+        verbose (bool): Print the timings of each model.
+
+    Returns:
+        pd.DataFrame: One row per model with its type, local file, the
+        seconds spent on metadata, download, load and warm-up, the total,
+        and the error message if the model could not be loaded.
+    """
+    columns = ["model_id", "type", "model_file", "metadata_s", "download_s"]
+    columns += ["load_s", "warmup_s", "total_s", "error"]
+    rows = []
+    for model_id in model_ids:
+        row = dict.fromkeys(columns, np.nan)
+        row.update(model_id=model_id, type=None, model_file=None, error=None)
+        start = time.perf_counter()
+        step = start
+        try:
+            model_df = memoized_model(model_id)
+            if model_df is None or model_df.empty:
+                raise ValueError(f"model {model_id} not found")
+            row["type"] = model_df.type.values[0]
+            now = time.perf_counter()
+            row["metadata_s"], step = now - step, now
+
+            row["model_file"] = model_cache.ensure_model(
+                model_id,
+                model_df.weights_url.values[0],
+                row["type"],
+                model_df.labels[0],
+            )
+            now = time.perf_counter()
+            row["download_s"], step = now - step, now
+
+            if row["type"] == "tf_lite":
+                pool = nn_inference.get_interpreter_pool(row["model_file"])
+                now = time.perf_counter()
+                row["load_s"], step = now - step, now
+                nn_inference.invoke_batch(pool, np.zeros((1,) + pool.input_shape))
+            else:
+                model = pls_model.load_pls_model(row["model_file"])
+                now = time.perf_counter()
+                row["load_s"], step = now - step, now
+                model.score(np.zeros(model.n_features))
+            now = time.perf_counter()
+            row["warmup_s"], step = now - step, now
+        except Exception as e:
+            row["error"] = str(e)
+        row["total_s"] = time.perf_counter() - start
+
+        if verbose:
+            print(
+                f"Model {model_id}: {row['total_s']:.2f}s"
+                + (f" ({row['error']})" if row["error"] else "")
+            )
+        rows.append(row)
+
+    return pd.DataFrame(rows, columns=columns)
+
+
 def show_prediction(card_id, model_id):
-    info = get_card(card_id)
+    info = memoized_card(card_id)
 
     if info is None:
         print(f"Failed to retrieve data for card {card_id}")
@@ -1037,13 +1315,13 @@ def show_prediction(card_id, model_id):
 
     # model data
 
-    model_df = get_model(model_id)
+    model_df = memoized_model(model_id)
     model_type = model_df.type.values[0]
     model_url = model_df.weights_url.values[0]
     model_file = os.path.basename(model_url)
 
-    # prediction
-    _, prediction = predict(card_id, model_id)
+    # prediction, reusing the card and model metadata
+    _, prediction = _predict(info, model_df, model_id)
     # if type of prediction is float
     if isinstance(prediction, float):
         # get 2 decimals precision and transform o str
@@ -1152,8 +1430,9 @@ def apply_predictions_to_dataframe(dataset_df, model_id):
                 }
             )
 
-    # Apply the prediction function to each row
-    results = dataset_df.apply(apply_predict, axis=1)
+    # Apply the prediction function to each row, fetching the model once
+    with metadata_session():
+        results = dataset_df.apply(apply_predict, axis=1)
     results["id"] = results["id"].astype(int)  # Convert 'id' to integer
 
     return results
@@ -2,66 +2,60 @@ import cv2 as cv
 import numpy as np
 
 
+# Takes a selection of pixels and an image and returns the per-channel sums
+# of the selected pixels and how many there are. The selection can be a list
+# of (x, y) pixels, a pair of (rows, cols) index arrays or a boolean mask
+# with the same height and width as the image.
+def sumPixels(pixels, img):
+    if isinstance(pixels, np.ndarray) and pixels.dtype == bool:
+        selected = img[pixels]
+    elif isinstance(pixels, tuple) and isinstance(pixels[0], np.ndarray):
+        selected = img[pixels[0], pixels[1]]
+    else:
+        index = np.asarray(pixels, dtype=np.intp).reshape(-1, 2)
+        selected = img[index[:, 0], index[:, 1]]
+    # Integer sums are exact, so the means match the old float accumulation
+    if np.issubdtype(img.dtype, np.integer):
+        sumType = np.int64
+    else:
+        sumType = np.float64
+    totals = selected.reshape(-1, img.shape[2]).sum(axis=0, dtype=sumType)
+    return totals.astype(np.float64), len(selected)
+
+
+# Takes a selection of pixels and an image and returns the per-channel means
+# as floats, or zeros if nothing was selected
+def meanPixels(pixels, img):
+    totals, count = sumPixels(pixels, img)
+    if count != 0:
+        totals /= count
+    return totals
+
+
 # Takes a list of pixels and a BGR image and returns the average
 # RGB pixel values
 def avgPixels(pixels, img):
-    totalB = 0.0  # Use float to prevent overflow
-    totalG = 0.0
-    totalR = 0.0
-    for pixel in pixels:
-        x = pixel[0]
-        y = pixel[1]
-        b, g, r = img[x, y, :]
-        # Convert to float to prevent overflow
-        totalB += float(b)
-        totalG += float(g)
-        totalR += float(r)
-    if len(pixels) != 0:
-        totalB /= len(pixels)
-        totalG /= len(pixels)
-        totalR /= len(pixels)
+    totalB, totalG, totalR = meanPixels(pixels, img).tolist()
     return int(totalR + 0.5), int(totalG + 0.5), int(totalB + 0.5)
 
 
 # Takes a list of pixels and a BGR image and returns the average
-# HSV pixel values
-def avgPixelsHSV(pixels, img):
-    workingImg = cv.cvtColor(img, cv.COLOR_BGR2HSV)
-    totalH = 0.0  # Use float to prevent overflow
-    totalS = 0.0
-    totalV = 0.0
-    for pixel in pixels:
-        x = pixel[0]
-        y = pixel[1]
-        h, s, v = workingImg[x, y, :]
-        # Convert to float to prevent overflow
-        totalH += float(h)
-        totalS += float(s)
-        totalV += float(v)
-    if len(pixels) != 0:
-        totalH /= len(pixels)
-        totalS /= len(pixels)
-        totalV /= len(pixels)
+# HSV pixel values. Pass the image already converted to HSV as hsvImg to
+# skip the conversion.
+def avgPixelsHSV(pixels, img, hsvImg=None):
+    workingImg = hsvImg
+    if workingImg is None:
+        workingImg = cv.cvtColor(img, cv.COLOR_BGR2HSV)
+    totalH, totalS, totalV = meanPixels(pixels, workingImg).tolist()
     return totalH, totalS, totalV
 
 
 # Takes a list of pixels and a BGR image and returns the average
-# Lab pixel values
-def avgPixelsLAB(pixels, img):
-    workingImg = cv.cvtColor(img, cv.COLOR_BGR2Lab)
-    totalL = 0.0  # Use float to prevent overflow
-    totalA = 0.0
-    totalB = 0.0
-    for pixel in pixels:
-        x = pixel[0]
-        y = pixel[1]
-        l, a, b = workingImg[x, y, :]
-        # Convert to float to prevent overflow
-        totalL += float(l)
-        totalA += float(a)
-        totalB += float(b)
-    if len(pixels) != 0:
-        totalL /= len(pixels)
-        totalA /= len(pixels)
-        totalB /= len(pixels)
+# Lab pixel values. Pass the image already converted to Lab as labImg to
+# skip the conversion.
+def avgPixelsLAB(pixels, img, labImg=None):
+    workingImg = labImg
+    if workingImg is None:
+        workingImg = cv.cvtColor(img, cv.COLOR_BGR2Lab)
+    totalL, totalA, totalB = meanPixels(pixels, workingImg).tolist()
     return int(totalL + 0.5), int(totalA + 0.5), int(totalB + 0.5)
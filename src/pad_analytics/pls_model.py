@@ -0,0 +1,211 @@
+"""PLS concentration models in matrix form.
+
+A coefficients file has one row per drug: the drug name, the offset and one
+coefficient per feature, in the order of regionRoutine.featureColumns(10).
+PLSModel keeps all rows in a single (n_drugs, 1 + n_features) matrix so any
+number of cards can be scored against any number of drugs with one matrix
+multiply.
+
+Models are shared process-wide through load_pls_model, so scoring many cards
+with the same coefficients file only parses it once.
+"""
+
+import csv
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Number of coefficient files kept parsed by load_pls_model
+MAX_CACHED_MODELS = 16
+
+_model_cache = OrderedDict()
+_model_cache_lock = threading.Lock()
+
+
+class PLSModel:
+    """PLS coefficients of several drugs as one NumPy matrix.
+
+    Parameters:
+        drugs (list of str): Drug names, one per coefficient row.
+        coefficients (array-like): (n_drugs, 1 + n_features) matrix, the
+            offset of each drug followed by its feature coefficients.
+    """
+
+    def __init__(self, drugs, coefficients):
+        self.drugs = list(drugs)
+        self.drug_index = {drug: i for i, drug in enumerate(self.drugs)}
+        self.coefficients = np.asarray(coefficients, dtype=np.float64).reshape(
+            len(self.drugs), -1
+        )
+        self.coefficients.setflags(write=False)
+        self.offsets = self.coefficients[:, 0]
+        self.weights = self.coefficients[:, 1:]
+
+    @classmethod
+    def from_csv(cls, coefficients_file):
+        """Load a PLS coefficients CSV file."""
+        drugs = []
+        rows = []
+        with open(coefficients_file) as csvcoeffs:
+            for row in csv.reader(csvcoeffs):
+                if not row:
+                    continue
+                drugs.append(row[0])
+                rows.append(row[1:])
+        return cls(drugs, np.array(rows, dtype=np.float64))
+
+    @property
+    def n_features(self):
+        return self.weights.shape[1]
+
+    def __contains__(self, drug):
+        return drug in self.drug_index
+
+    def indices(self, drugs):
+        """Row indices of drug names, raising KeyError for unknown drugs."""
+        return np.array([self.drug_index[drug] for drug in drugs], dtype=np.intp)
+
+    def score(self, features, drugs=None):
+        """Predict concentrations for a batch of feature vectors.
+
+        Parameters:
+            features (np.ndarray): (n_features,) vector or (B, n_features)
+                batch, e.g. from regionRoutine.extractFeatureVectors.
+            drugs (str, list of str or None): One drug, several drugs or
+                None for every drug in the model.
+
+        Returns:
+            np.ndarray: Concentrations with shape (B, n_drugs), or (B,) for a
+            single drug name. The batch axis is dropped for a single vector.
+        """
+        features = np.asarray(features)
+        single_drug = isinstance(drugs, str)
+        if drugs is None:
+            weights, offsets = self.weights, self.offsets
+        else:
+            rows = self.indices([drugs] if single_drug else drugs)
+            weights, offsets = self.weights[rows], self.offsets[rows]
+        scores = features @ weights.T + offsets
+        if single_drug:
+            scores = scores[..., 0]
+        return scores
+
+    def score_rows(self, features, drugs, chunk_size=16384):
+        """Predict the concentration of each feature row for its own drug.
+
+        Rows are read chunk_size at a time, so features can be a
+        memory-mapped array larger than memory.
+
+        Parameters:
+            features (array-like): (B, n_features) feature rows.
+            drugs (array-like of str): (B,) drug name of each row.
+            chunk_size (int): Rows scored per chunk.
+
+        Returns:
+            np.ndarray: (B,) concentrations, NaN where the drug is not in the
+            model.
+        """
+        drugs = list(drugs)
+        if len(drugs) != len(features):
+            raise ValueError(
+                f"Got {len(features)} feature rows but {len(drugs)} drug names"
+            )
+        rows = np.array(
+            [self.drug_index.get(drug, -1) for drug in drugs], dtype=np.intp
+        )
+        scores = np.full(len(drugs), np.nan)
+        for start in range(0, len(drugs), chunk_size):
+            stop = start + chunk_size
+            chunk = np.asarray(features[start:stop], dtype=np.float64)
+            chunk_rows = rows[start:stop]
+            chunk_scores = scores[start:stop]
+            for row in np.unique(chunk_rows[chunk_rows >= 0]):
+                selected = chunk_rows == row
+                chunk_scores[selected] = (
+                    chunk[selected] @ self.weights[row] + self.offsets[row]
+                )
+        return scores
+
+
+def score_feature_table(model, features, drugs=None, drug_column="Contains"):
+    """Score stored PLS features in bulk, without any image processing.
+
+    Parameters:
+        model (PLSModel): The coefficients to score with.
+        features: One of
+            - a DataFrame with the regionRoutine.featureColumns(10) columns
+              ("A1-R" ... "L10-B"), like the 10_region_rgb CSV files,
+            - a (B, 360) array, including a np.memmap,
+            - the path of a .npy file, which is memory-mapped.
+        drugs (array-like of str, optional): Drug name of each row. Required
+            for arrays; for a DataFrame it defaults to drug_column.
+        drug_column (str): DataFrame column holding the drug names.
+
+    Returns:
+        pd.Series (for a DataFrame, with the same index) or np.ndarray of
+        concentrations, NaN for rows whose drug is not in the model.
+    """
+    from . import regionRoutine
+
+    index = None
+    if isinstance(features, (str, os.PathLike)):
+        features = np.load(features, mmap_mode="r")
+    elif hasattr(features, "columns"):
+        if drugs is None:
+            drugs = features[drug_column]
+        index = features.index
+        columns = list(regionRoutine.featureColumns(10, True))
+        features = features[columns].to_numpy(dtype=np.float64)
+    if drugs is None:
+        raise ValueError("drugs must be given when scoring a feature array")
+
+    drugs = [str(drug).lower() for drug in drugs]
+    scores = model.score_rows(features, drugs)
+    if index is not None:
+        import pandas as pd
+
+        return pd.Series(scores, index=index, name="prediction")
+    return scores
+
+
+def load_pls_model(coefficients_file):
+    """Load a PLS coefficients file through a process-wide LRU cache.
+
+    The cache is keyed by the absolute path together with the file's
+    modification time and size, so a rewritten file is parsed again. The
+    least recently used models are evicted beyond MAX_CACHED_MODELS.
+
+    Parameters:
+        coefficients_file (str): Path to the coefficients CSV file.
+
+    Returns:
+        PLSModel: The shared, read-only model.
+    """
+    path = os.path.abspath(coefficients_file)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _model_cache_lock:
+        model = _model_cache.get(key)
+        if model is not None:
+            _model_cache.move_to_end(key)
+            return model
+
+    model = PLSModel.from_csv(path)
+
+    with _model_cache_lock:
+        # drop older versions of the same file
+        for stale in [k for k in _model_cache if k[0] == path and k != key]:
+            del _model_cache[stale]
+        _model_cache[key] = model
+        _model_cache.move_to_end(key)
+        while len(_model_cache) > MAX_CACHED_MODELS:
+            _model_cache.popitem(last=False)
+    return model
+
+
+def clear_pls_cache():
+    """Forget every model loaded by load_pls_model."""
+    with _model_cache_lock:
+        _model_cache.clear()
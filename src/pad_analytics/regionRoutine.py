@@ -9,11 +9,16 @@ import csv
 import urllib.request
 import warnings
 import math
+import functools
+import itertools
 from datetime import datetime
 import tempfile
 
 HORIZONTAL_BORDER = 12
 VERTICAL_BORDER = 0
+LANES = 12
+CARD_SHAPES = [(1250, 730, 3), (1220, 730, 3)]
+LANE_LETTERS = ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L"]
 SAVE_DIR = "./Data/"
 REQS = {
     "ORIG_DIR": "Original_Images",
@@ -24,16 +29,105 @@ REQS = {
 }
 
 
-def regionGen(regions, region):
+def regionGen(regions, region, verticalBorder=None):
+    if verticalBorder is None:
+        verticalBorder = VERTICAL_BORDER
     start = 359
     totalLength = 273
-    regionStart = start + math.floor(totalLength * (region / regions)) + VERTICAL_BORDER
+    regionStart = start + math.floor(totalLength * (region / regions)) + verticalBorder
     regionEnd = (
-        start + math.floor(totalLength * ((region + 1) / regions)) - VERTICAL_BORDER
+        start + math.floor(totalLength * ((region + 1) / regions)) - verticalBorder
     )
     return regionStart, regionEnd
 
 
+def laneBounds(lane, horizontalBorder=None):
+    if horizontalBorder is None:
+        horizontalBorder = HORIZONTAL_BORDER
+    laneStart = 17 + (53 * lane) + horizontalBorder
+    laneEnd = 17 + (53 * (lane + 1)) - horizontalBorder
+    return laneStart, laneEnd
+
+
+# Precomputed lane/region geometry of a card: the lane and region bounds,
+# the band of rows they cover, the region id of every band row and the
+# cosine weights and black-bar thresholds of every ROI laid out on the band.
+# Build it with getCardLayout so each (regions, borders, image shape)
+# combination is only computed once.
+class CardLayout:
+    def __init__(self, regions, horizontalBorder, verticalBorder, shape):
+        self.regions = regions
+        self.horizontalBorder = horizontalBorder
+        self.verticalBorder = verticalBorder
+        self.shape = shape
+        self.laneBounds = [laneBounds(lane, horizontalBorder) for lane in range(1, 13)]
+        self.regionBounds = [
+            regionGen(regions, region, verticalBorder) for region in range(regions)
+        ]
+        self.laneStart = self.laneBounds[0][0]
+        self.laneWidth = self.laneBounds[0][1] - self.laneStart
+        self.bandStart = self.regionBounds[0][0]
+        self.bandEnd = self.regionBounds[-1][1]
+        if shape[0] < self.bandEnd or shape[1] < self.laneStart + 53 * LANES:
+            raise ValueError(
+                "Image shape %s is too small for the card layout." % str(shape)
+            )
+
+        bandRows = self.bandEnd - self.bandStart
+        # offsets of the regions in the band, the segments for np.add.reduceat
+        self.regionStarts = np.array(
+            [start - self.bandStart for start, _ in self.regionBounds]
+        )
+        # region of every band row, -1 for the rows between regions
+        self.regionIds = np.full(bandRows, -1)
+        self.weights = np.zeros((bandRows, self.laneWidth))
+        self.threshS = np.zeros((bandRows, self.laneWidth), dtype=np.uint8)
+        self.threshV = np.zeros((bandRows, self.laneWidth), dtype=np.uint8)
+        for region, (regionStart, regionEnd) in enumerate(self.regionBounds):
+            rows = slice(regionStart - self.bandStart, regionEnd - self.bandStart)
+            roiShape = (regionEnd - regionStart, self.laneWidth)
+            self.regionIds[rows] = region
+            self.weights[rows] = intFind.cosWeightGrid(*roiShape)
+            self.threshS[rows], self.threshV[rows] = intFind.cosThresholdGrids(
+                *roiShape
+            )
+        # rows outside every region get thresholds no pixel can exceed
+        self.threshS[self.regionIds < 0] = 255
+        self.threshV[self.regionIds < 0] = 255
+        for table in (
+            self.regionStarts,
+            self.regionIds,
+            self.weights,
+            self.threshS,
+            self.threshV,
+        ):
+            table.setflags(write=False)
+
+    # Splits rows of a full-width image starting at the band into its 12
+    # lanes, giving a (rows, 12, laneWidth, channels) view
+    def lanes(self, bandImg):
+        lanes = bandImg[:, self.laneStart : self.laneStart + 53 * LANES]
+        lanes = lanes.reshape(bandImg.shape[0], LANES, 53, bandImg.shape[2])
+        return lanes[:, :, : self.laneWidth]
+
+
+# Returns the memoized CardLayout for a region count, border settings and
+# image shape. The borders default to HORIZONTAL_BORDER / VERTICAL_BORDER.
+def getCardLayout(
+    regions, horizontalBorder=None, verticalBorder=None, shape=CARD_SHAPES[0]
+):
+    if horizontalBorder is None:
+        horizontalBorder = HORIZONTAL_BORDER
+    if verticalBorder is None:
+        verticalBorder = VERTICAL_BORDER
+    return _cachedLayout(regions, horizontalBorder, verticalBorder, tuple(shape[:2]))
+
+
+@functools.lru_cache(maxsize=64)
+def _cachedLayout(regions, horizontalBorder, verticalBorder, shape):
+    return CardLayout(regions, horizontalBorder, verticalBorder, shape)
+
+
 """
 This is a major hack at this point. Eventually I could refactor it to work
 nice and programatically, for now I'll revel in the hack.
@@ -47,20 +141,22 @@ def fullRoutine_old(img, roiFunc, RGB=True, regions=3, display=False):
     gList = []
     bList = []
     imgHSV = cv.cvtColor(img, cv.COLOR_BGR2HSV)
+    imgLab = cv.cvtColor(img, cv.COLOR_BGR2Lab)
     if display:
         cv.imshow("in", imgC)
         cv.imshow("out", imgHSV[:, :, 1])
         cv.waitKey()
+    layout = getCardLayout(regions, shape=img.shape)
     for lane in range(1, 13):
-        laneStart = 17 + (53 * lane) + HORIZONTAL_BORDER
-        laneEnd = 17 + (53 * (lane + 1)) - HORIZONTAL_BORDER
+        laneStart, laneEnd = layout.laneBounds[lane - 1]
         for region in range(regions):
-            regionStart, regionEnd = regionGen(regions, region)
+            regionStart, regionEnd = layout.regionBounds[region]
             roi = imgHSV[regionStart:regionEnd, laneStart:laneEnd, :]
             rgbROI = img[regionStart:regionEnd, laneStart:laneEnd, :]
             pixels = roiFunc(roi)
             r, g, b = px.avgPixels(pixels, rgbROI)
-            l, a, blu = px.avgPixelsLAB(pixels, rgbROI)
+            labROI = imgLab[regionStart:regionEnd, laneStart:laneEnd, :]
+            l, a, blu = px.avgPixelsLAB(pixels, rgbROI, labROI)
             temp = np.zeros(
                 (regionEnd - regionStart, laneEnd - laneStart, 3), dtype="uint8"
             )
@@ -112,20 +208,174 @@ def fullRoutine_old(img, roiFunc, RGB=True, regions=3, display=False):
     return fImg, df
 
 
+# Whole-card version of fullRoutine with findMaxIntensitiesFiltered as the
+# ROI function. Filters the lane/region band in one pass and reduces every
+# ROI at once, returning a (12, regions, 3) array of the rounded R, G, B
+# (or L, a, b) averages of each lane and region.
+def extractFeatures(img, RGB=True, regions=3):
+    return extractFeatureSets(img, [(regions, RGB)])[0]
+
+
+# Runs extractFeatures for a list of (regions, RGB) configurations in one
+# pass. The lane pixels of the band are converted to HSV (and Lab, if
+# needed) once and the filter mask is built once per region count, then
+# each configuration only re-bins the ROIs. Returns one feature array per
+# configuration, in order.
+def extractFeatureSets(img, configs):
+    layouts, unionStart, unionEnd = _unionLayout(configs, img.shape)
+    lanes = layouts[configs[0][0]].lanes(img[unionStart:unionEnd])[None]
+    featureSets = _laneFeatureSets(lanes, configs, layouts, unionStart)
+    return [features[0] for features in featureSets]
+
+
+# Batched extractFeatures. Takes a (B, H, W, 3) uint8 stack or any iterable
+# of card images, each (1250, 730, 3) or (1220, 730, 3), and returns a
+# (B, 12, regions, 3) array. Images are processed chunkSize at a time, with
+# one colour conversion, filter and reduction per chunk, so memory stays
+# bounded for long iterators.
+def extractFeaturesBatch(images, RGB=True, regions=3, chunkSize=8):
+    configs = [(regions, RGB)]
+    # the band is the same for every card shape
+    layouts, unionStart, unionEnd = _unionLayout(configs, CARD_SHAPES[0])
+    layout = layouts[regions]
+    buffer = np.empty(
+        (chunkSize, unionEnd - unionStart, LANES, layout.laneWidth, 3), "uint8"
+    )
+    chunks = []
+    images = iter(images)
+    while True:
+        count = 0
+        for img in itertools.islice(images, chunkSize):
+            if img.shape not in CARD_SHAPES:
+                raise ValueError(
+                    "Expected shape (1250, 730, 3) or (1220, 730, 3), found shape %s."
+                    % str(img.shape)
+                )
+            buffer[count] = layout.lanes(img[unionStart:unionEnd])
+            count += 1
+        if count == 0:
+            break
+        lanes = buffer[:count]
+        chunks.append(_laneFeatureSets(lanes, configs, layouts, unionStart)[0])
+    if not chunks:
+        return np.zeros((0, LANES, regions, 3))
+    return np.concatenate(chunks)
+
+
+# Card layouts of every region count in configs, and the rows covering all
+# of their bands
+def _unionLayout(configs, shape):
+    layouts = {regions: getCardLayout(regions, shape=shape) for regions, _ in configs}
+    unionStart = min(layout.bandStart for layout in layouts.values())
+    unionEnd = max(layout.bandEnd for layout in layouts.values())
+    return layouts, unionStart, unionEnd
+
+
+# Feature arrays of every configuration for a (B, rows, 12, laneWidth, 3)
+# stack of BGR lane pixels starting at card row unionStart
+def _laneFeatureSets(lanes, configs, layouts, unionStart):
+    hsv = _convertLanes(lanes, cv.COLOR_BGR2HSV)
+    lab = None
+    if not all(RGB for _, RGB in configs):
+        lab = _convertLanes(lanes, cv.COLOR_BGR2Lab)
+
+    masks = {}
+    results = []
+    for regions, RGB in configs:
+        layout = layouts[regions]
+        rows = slice(layout.bandStart - unionStart, layout.bandEnd - unionStart)
+        if regions not in masks:
+            masks[regions] = _filterMask(hsv[:, rows], layout.threshS, layout.threshV)
+        values = (lanes if RGB else lab)[:, rows]
+        features = _reduceRegions(values, masks[regions], layout.regionStarts)
+        if RGB:
+            # BGR -> RGB
+            features = features[..., ::-1]
+        results.append(features)
+    return results
+
+
+# Converts the colour space of (..., 12, laneWidth, 3) lane pixels. Only
+# the pixels inside the lanes are converted, the borders between them are
+# never read.
+def _convertLanes(lanes, code):
+    flat = np.ascontiguousarray(lanes).reshape(-1, LANES * lanes.shape[-2], 3)
+    return cv.cvtColor(flat, code).reshape(lanes.shape)
+
+
+# Keeps the pixels of the (..., rows, 12, laneWidth, 3) HSV lanes that are
+# not black bars, using the per-pixel thresholds of the card layout
+def _filterMask(hsvLanes, threshS, threshV):
+    return (hsvLanes[..., 1] > threshS[:, None, :]) | (
+        hsvLanes[..., 2] > threshV[:, None, :]
+    )
+
+
+# Averages the kept pixels of every ROI of (..., rows, 12, laneWidth, 3)
+# lanes, giving a (..., 12, regions, channels) array rounded the same way as
+# pixelProcessing.avgPixels
+def _reduceRegions(values, keep, regionStarts):
+    # Per row sums as a batched float32 matmul, then segmented over the rows
+    # of each region. Every partial sum is an integer below 2**24, so float32
+    # is exact and the averages match the per-pixel loop.
+    rowTotals = np.matmul(
+        np.swapaxes(values.astype(np.float32), -1, -2),
+        keep[..., None].astype(np.float32),
+    )[..., 0].astype(np.int64)
+    totals = np.add.reduceat(rowTotals, regionStarts, axis=-3)
+    counts = np.add.reduceat(keep.sum(axis=-1), regionStarts, axis=-2)
+
+    means = np.zeros(totals.shape)
+    np.divide(totals, counts[..., None], out=means, where=counts[..., None] != 0)
+    return np.swapaxes(np.floor(means + 0.5), -3, -2)
+
+
+# Flat float32 version of extractFeatures: a contiguous vector of
+# 12 * regions * 3 values in the order of featureColumns(regions, RGB)
+def extractFeatureVector(img, RGB=True, regions=3):
+    return np.ascontiguousarray(extractFeatures(img, RGB, regions), np.float32).ravel()
+
+
+# Flat float32 version of extractFeaturesBatch: a (B, 12 * regions * 3)
+# array with the columns of featureColumns(regions, RGB)
+def extractFeatureVectors(images, RGB=True, regions=3, chunkSize=8):
+    features = extractFeaturesBatch(images, RGB, regions, chunkSize)
+    return np.ascontiguousarray(features, np.float32).reshape(len(features), -1)
+
+
+# Column names of the feature vectors ("A1-R", "A1-G", ...), shared and
+# built once per region count and colour space
+@functools.lru_cache(maxsize=32)
+def featureColumns(regions=3, RGB=True):
+    colors = ["R", "G", "B"] if RGB else ["L", "a", "b"]
+    return tuple(fm.genIndex(regions, colors)[4:])
+
+
+# Writes a (12, regions, 3) feature array into df with the "A1-R" style keys
+def featuresToDict(features, df, RGB=True):
+    regions = features.shape[1]
+    values = np.asarray(features).astype(int).ravel().tolist()
+    df.update(zip(featureColumns(regions, RGB), values))
+    return df
+
+
 def fullRoutine(img, roiFunc, df, RGB=True, regions=3):
-    letters = ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L"]
-    rList = []
-    gList = []
-    bList = []
-    imgHSV = cv.cvtColor(img, cv.COLOR_BGR2HSV)
+    if roiFunc is intFind.findMaxIntensitiesFiltered:
+        return featuresToDict(extractFeatures(img, RGB, regions), df, RGB)
+    # Only the band is read, so only the band is converted, once
+    layout = getCardLayout(regions, shape=img.shape)
+    bandStart = layout.bandStart
+    band = img[bandStart : layout.bandEnd]
+    bandHSV = cv.cvtColor(band, cv.COLOR_BGR2HSV)
+    bandLab = None if RGB else cv.cvtColor(band, cv.COLOR_BGR2Lab)
     for lane in range(1, 13):
-        laneStart = 17 + (53 * lane) + HORIZONTAL_BORDER
-        laneEnd = 17 + (53 * (lane + 1)) - HORIZONTAL_BORDER
-        letter = letters[lane - 1]
+        laneStart, laneEnd = layout.laneBounds[lane - 1]
+        letter = LANE_LETTERS[lane - 1]
         for region in range(regions):
-            regionStart, regionEnd = regionGen(regions, region)
-            roi = imgHSV[regionStart:regionEnd, laneStart:laneEnd, :]
-            rgbROI = img[regionStart:regionEnd, laneStart:laneEnd, :]
+            regionStart, regionEnd = layout.regionBounds[region]
+            rows = slice(regionStart - bandStart, regionEnd - bandStart)
+            roi = bandHSV[rows, laneStart:laneEnd, :]
+            rgbROI = band[rows, laneStart:laneEnd, :]
             pixels = roiFunc(roi)
             tempString = letter + str(region + 1) + "-"
             # Switches between RGB and Lab
@@ -135,7 +385,8 @@ def fullRoutine(img, roiFunc, df, RGB=True, regions=3):
                 df[tempString + "G"] = g
                 df[tempString + "B"] = b
             else:
-                l, a, blu = px.avgPixelsLAB(pixels, rgbROI)
+                labROI = bandLab[rows, laneStart:laneEnd, :]
+                l, a, blu = px.avgPixelsLAB(pixels, rgbROI, labROI)
                 df[tempString + "L"] = l
                 df[tempString + "a"] = a
                 df[tempString + "b"] = blu
@@ -152,7 +403,7 @@ def directorySearch(target, RGB=True, regions=3, save_dir=SAVE_DIR):
         print(file)
         try:
             img = cv.imread(target + file)
-            if (1250, 730, 3) != img.shape and (1220, 730, 3) != img.shape:
+            if img.shape not in CARD_SHAPES:
                 errorString = str.format(
                     "Error with file %s. Expected shape %s, found shape %s.\n"
                     % (file, "(1250, 730, 3) or (1220, 730, 3)", str(img.shape))
@@ -215,7 +466,7 @@ def csvReader(target, runSettings, save_dir=SAVE_DIR):
             try:
                 urllib.request.urlretrieve(url + row[7], dest)
                 img = cv.imread(dest)
-                if (1250, 730, 3) != img.shape and (1220, 730, 3) != img.shape:
+                if img.shape not in CARD_SHAPES:
                     errorString = str.format(
                         "Error with file %s. Expected shape %s, found shape %s.\n"
                         % (file, "(1250, 730, 3) or (1220, 730, 3)", str(img.shape))
@@ -223,15 +474,13 @@ def csvReader(target, runSettings, save_dir=SAVE_DIR):
                     errors.write(errorString)
                     warnings.warn(errorString)
                 else:
-                    for setting in runSettings:
-                        data = {}
-                        data = fullRoutine(
-                            img,
-                            intFind.findMaxIntensitiesFiltered,
-                            data,
-                            runSettings[setting]["RGB"],
-                            runSettings[setting]["regions"],
-                        )
+                    configs = [
+                        (runSettings[setting]["regions"], runSettings[setting]["RGB"])
+                        for setting in runSettings
+                    ]
+                    featureSets = extractFeatureSets(img, configs)
+                    for setting, features in zip(runSettings, featureSets):
+                        data = featuresToDict(features, {}, runSettings[setting]["RGB"])
                         data["Image"] = row[0]
                         data["Contains"] = row[1]
                         data["Drug %"] = row[18]
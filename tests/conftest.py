@@ -40,6 +40,55 @@ def mock_requests():
         yield mock_get, mock_response
 
 
+@pytest.fixture
+def synthetic_card():
+    """Factory of random card images with many pixels near the black-bar thresholds."""
+    import numpy as np
+
+    def make(rng, shape=(1250, 730, 3)):
+        noise = rng.integers(0, 256, shape, dtype=np.uint8) // 3
+        shade = rng.integers(0, 60, shape[:2] + (1,))
+        return np.clip(noise + shade, 0, 255).astype(np.uint8)
+
+    return make
+
+
+@pytest.fixture
+def stand_in_server(monkeypatch):
+    """Factory of local stand-ins for the PAD server.
+
+    Calling it with a BaseHTTPRequestHandler subclass starts a threaded
+    server and points the API URLs and a fresh HTTP client at it. The
+    server records its requests in httpd.requests, and httpd.version is a
+    counter the handler can serve different content by. Servers are shut
+    down, and the metadata cache is disabled, after the test.
+    """
+    import threading
+    from http.server import ThreadingHTTPServer
+    from pad_analytics import padanalytics, http_client, metadata_cache
+
+    servers = []
+
+    def start(handler_class):
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        httpd.requests = []
+        httpd.version = 1
+        httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        servers.append(httpd)
+        monkeypatch.setattr(padanalytics, "API_URL", httpd.url + "/api/v2")
+        monkeypatch.setattr(padanalytics, "API_LD_URL", httpd.url + "/api-ld/v3")
+        http_client.configure_client()
+        return httpd
+
+    yield start
+    metadata_cache.disable_metadata_cache()
+    http_client.configure_client()
+    for httpd in servers:
+        httpd.shutdown()
+        httpd.server_close()
+
+
 @pytest.fixture
 def sample_card_data():
     """Provide sample card data for testing."""
@@ -0,0 +1,179 @@
+"""Test the pooled HTTP client against a local stand-in for the PAD server."""
+
+import pytest
+import sys
+import os
+import io
+import json
+import time
+from http.server import BaseHTTPRequestHandler
+import pandas as pd
+from PIL import Image
+
+# Add src to path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pad_analytics import padanalytics, http_client
+
+
+def png_bytes(size=(40, 30)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 10, 10)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves JSON cards and a PNG image over keep-alive HTTP/1.1."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.client_address))
+        if self.path.startswith("/api/v2/projects/"):
+            # cards of project n, answered after n / 10 seconds
+            project_id = int(self.path.split("/")[4])
+            time.sleep(project_id / 10)
+            cards = [{"id": project_id * 100 + i, "project": project_id} for i in range(2)]
+            body = json.dumps(cards).encode()
+            content_type = "application/json"
+        elif self.path.startswith("/api/v2/cards/"):
+            card_id = int(self.path.rsplit("/", 1)[1])
+            if card_id >= 900:
+                self.send_error(404)
+                return
+            card = {
+                "id": card_id,
+                "sample_name": "Amoxicillin",
+                "quantity": 50 + card_id % 2,
+                "date_of_creation": "2024-03-0%dT10:00:00Z" % (card_id % 9 + 1),
+                "deleted": False,
+                "project": {"id": 12, "project_name": "FHI2022"},
+            }
+            body = json.dumps(card).encode()
+            content_type = "application/json"
+        elif self.path.startswith("/api-ld/v3/cards/by-sample/"):
+            body = json.dumps({"success": True, "data": []}).encode()
+            content_type = "application/json"
+        elif self.path.endswith(".png"):
+            body = png_bytes()
+            content_type = "image/png"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except BrokenPipeError:  # the client timed out
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(stand_in_server):
+    """Run the stand-in server and point the API URLs at it."""
+    httpd = stand_in_server(StandInHandler)
+    return httpd.url, httpd.requests
+
+
+class TestHttpClient:
+    """Test that API and image requests share pooled connections."""
+
+    def test_connections_are_reused(self, server):
+        """Requests to one host come over kept-alive connections."""
+        url, requests_seen = server
+        for card_id in (1, 2, 3):
+            card = padanalytics.get_card(card_id)
+            assert card.id.tolist() == [card_id]
+        assert padanalytics.get_card(sample_id=7).empty
+        assert padanalytics.load_image_from_url(url + "/card.png").size == (40, 30)
+        assert padanalytics.read_img(url + "/card.png").size == (40, 30)
+        assert padanalytics.create_thumbnail(url + "/card.png", (10, 10)).size == (10, 8)
+
+        assert len(requests_seen) == 7
+        # get_data_api passes verify=False, which has a pool of its own
+        addresses = [address for _, address in requests_seen]
+        assert len(set(addresses[:3])) == 1
+        assert len(set(addresses[3:])) == 1
+
+    def test_download_file(self, server, tmp_path):
+        url, requests_seen = server
+        padanalytics.download_file(url + "/card.png", "card.png", str(tmp_path))
+        assert (tmp_path / "card.png").read_bytes() == png_bytes()
+        with pytest.raises(Exception):
+            padanalytics.download_file(url + "/missing", "missing", str(tmp_path))
+
+        # failed downloads give their connection back to the pool
+        client = http_client.get_client()
+        pools = client.session.get_adapter(url).poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            assert pool.pool.qsize() == pool.pool.maxsize
+
+    def test_configure_client(self, server):
+        """A configured client replaces the shared one with its own pool."""
+        url, _ = server
+        client = http_client.configure_client(pool_maxsize=2, timeout=5, headers={"X-Test": "1"})
+        assert http_client.get_client() is client
+        response = http_client.get(url + "/card.png")
+        assert response.status_code == 200
+        assert client.session.headers["X-Test"] == "1"
+        assert client.session.get_adapter(url)._pool_maxsize == 2
+
+
+class TestProjectCards:
+    """Test fetching the cards of several projects concurrently."""
+
+    def test_projects_are_fetched_concurrently(self, server):
+        start = time.perf_counter()
+        cards = padanalytics.get_project_cards(project_ids=[3, 1, 2])
+        elapsed = time.perf_counter() - start
+
+        # in the order of project_ids, not of completion
+        assert cards.project.tolist() == [3, 3, 1, 1, 2, 2]
+        assert cards.id.tolist() == [300, 301, 100, 101, 200, 201]
+        # about as long as the slowest project, not the sum
+        assert elapsed < 0.55
+
+    def test_max_workers(self, server):
+        start = time.perf_counter()
+        cards = padanalytics.get_project_cards(project_ids=[2, 2, 2], max_workers=1)
+        assert time.perf_counter() - start >= 0.6
+        assert len(cards) == 6
+
+    def test_timeout_skips_slow_projects(self, server):
+        cards = padanalytics.get_project_cards(project_ids=[1, 5], timeout=0.3)
+        assert cards.project.tolist() == [1, 1]
+        assert padanalytics.get_project_cards(project_ids=[5], timeout=0.3) is None
+
+
+class TestGetCards:
+    """Test the bulk card lookup."""
+
+    def test_get_cards(self, server):
+        url, requests_seen = server
+        cards, failures = padanalytics.get_cards([5, 3, 950, 4, 3], max_workers=4)
+
+        assert cards.id.tolist() == [5, 3, 4]
+        assert cards["project.id"].tolist() == [12, 12, 12]
+        assert str(cards.id.dtype) == "Int64"
+        assert str(cards.quantity.dtype) == "float64"
+        assert str(cards.deleted.dtype) == "boolean"
+        assert isinstance(cards.date_of_creation.dtype, pd.DatetimeTZDtype)
+        assert cards.date_of_creation[0] == pd.Timestamp("2024-03-06T10:00:00Z")
+
+        assert failures.id.tolist() == [950]
+        assert failures.status_code.tolist() == [404]
+        # repeated ids are requested once
+        assert len(requests_seen) == 4
+
+    def test_all_failed_or_empty(self, server):
+        cards, failures = padanalytics.get_cards([901, 902])
+        assert cards.empty
+        assert failures.id.tolist() == [901, 902]
+        cards, failures = padanalytics.get_cards([])
+        assert cards.empty and failures.empty
@@ -0,0 +1,184 @@
+"""Test the vectorized image processing routines against the per-pixel reference."""
+
+import pytest
+import sys
+import os
+import numpy as np
+
+# Add src to path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pad_analytics import intensityFind, pixelProcessing, regionRoutine
+
+
+def reference_filtered_pixels(img):
+    """Per-pixel version of findMaxIntensitiesFiltered, kept for comparison."""
+    imgS = img[:, :, 1]
+    imgV = img[:, :, 2]
+    centerX = imgS.shape[0] / 2
+    centerY = imgS.shape[1] / 2
+    maxSet = []
+    for i in range(imgS.shape[0]):
+        dX = abs(centerX - i)
+        for j in range(imgS.shape[1]):
+            dY = abs(centerY - j)
+            sF = intensityFind.cosCorrectFactor(dX, dY, centerX, centerY)
+            if sF * imgS[i, j] <= intensityFind.BLACK_THRESH_S and sF * imgV[i, j] <= intensityFind.BLACK_THRESH_V:
+                continue
+            maxSet.append((i, j))
+    return maxSet
+
+
+def random_hsv_roi(rng, shape):
+    """Random HSV ROI with S/V values around the black-bar thresholds."""
+    img = rng.integers(0, 256, shape + (3,), dtype=np.uint8)
+    img[:, :, 1] = rng.integers(0, 80, shape)
+    img[:, :, 2] = rng.integers(0, 160, shape)
+    return img
+
+
+class TestIntensityFind:
+    """Test the mask engine behind findMaxIntensitiesFiltered."""
+
+    @pytest.mark.parametrize("shape", [(27, 29), (28, 29), (91, 29), (5, 7)])
+    def test_same_selection_as_reference(self, shape):
+        """The mask engine keeps exactly the pixels of the per-pixel loop."""
+        rng = np.random.default_rng(0)
+        for _ in range(5):
+            img = random_hsv_roi(rng, shape)
+            assert intensityFind.findMaxIntensitiesFiltered(img) == reference_filtered_pixels(img)
+
+    def test_mask_form(self):
+        """asMask returns a boolean mask matching the legacy list."""
+        img = random_hsv_roi(np.random.default_rng(1), (27, 29))
+        mask = intensityFind.findMaxIntensitiesFiltered(img, asMask=True)
+        assert mask.dtype == bool
+        assert mask.shape == (27, 29)
+        assert sorted(zip(*np.nonzero(mask))) == intensityFind.findMaxIntensitiesFiltered(img)
+
+    def test_threshold_grids_match_exhaustive_search(self):
+        """Per-pixel thresholds equal the largest value whose weighted value is under."""
+        rng = np.random.default_rng(2)
+        boundary = [35 / k for k in range(1, 256)] + [70 / k for k in range(1, 256)]
+        weights = np.concatenate([
+            intensityFind.cosWeightGrid(40, 33).ravel(),
+            rng.random(2000) ** 8,
+            boundary,
+            [1.0, 1e-300],
+        ])[None, :]
+        values = np.arange(256)
+        grids = intensityFind.thresholdGrids(weights)
+        for thresh, grid in zip((intensityFind.BLACK_THRESH_S, intensityFind.BLACK_THRESH_V), grids):
+            expected = (weights[:, :, None] * values <= thresh).sum(axis=2) - 1
+            np.testing.assert_array_equal(grid, expected)
+
+    def test_weight_grid_is_cached(self):
+        """The cosine weight grid is built once per ROI shape."""
+        grid = intensityFind.cosWeightGrid(27, 29)
+        assert intensityFind.cosWeightGrid(27, 29) is grid
+        assert not grid.flags.writeable
+        assert grid[13, 14] == pytest.approx(intensityFind.cosCorrectFactor(0.5, 0.5, 13.5, 14.5))
+
+
+class TestPixelProcessing:
+    """Test the vectorized colour averaging in pixelProcessing."""
+
+    @staticmethod
+    def reference_means(pixels, img):
+        totals = [0.0, 0.0, 0.0]
+        for x, y in pixels:
+            for c in range(3):
+                totals[c] += float(img[x, y, c])
+        if len(pixels) != 0:
+            totals = [t / len(pixels) for t in totals]
+        return totals
+
+    def test_selection_forms_match(self):
+        """Pixel lists, index arrays and masks give the exact legacy means."""
+        rng = np.random.default_rng(2)
+        img = rng.integers(0, 256, (28, 29, 3), dtype=np.uint8)
+        mask = rng.random((28, 29)) < 0.6
+        pixels = [tuple(p) for p in np.argwhere(mask).tolist()]
+        expected = self.reference_means(pixels, img)
+        assert pixelProcessing.meanPixels(pixels, img).tolist() == expected
+        assert pixelProcessing.meanPixels(mask, img).tolist() == expected
+        assert pixelProcessing.meanPixels(np.nonzero(mask), img).tolist() == expected
+        assert pixelProcessing.avgPixels(mask, img) == pixelProcessing.avgPixels(pixels, img)
+        assert pixelProcessing.avgPixelsLAB(mask, img) == pixelProcessing.avgPixelsLAB(pixels, img)
+
+    def test_preconverted_planes(self):
+        """Passing the converted image skips the conversion, same result."""
+        import cv2 as cv
+
+        rng = np.random.default_rng(6)
+        img = rng.integers(0, 256, (28, 29, 3), dtype=np.uint8)
+        mask = rng.random((28, 29)) < 0.5
+        lab = cv.cvtColor(img, cv.COLOR_BGR2Lab)
+        hsv = cv.cvtColor(img, cv.COLOR_BGR2HSV)
+        assert pixelProcessing.avgPixelsLAB(mask, img, lab) == pixelProcessing.avgPixelsLAB(mask, img)
+        assert pixelProcessing.avgPixelsHSV(mask, img, hsv) == pixelProcessing.avgPixelsHSV(mask, img)
+
+    def test_empty_selection(self):
+        """An empty selection averages to zero, as before."""
+        img = np.full((4, 4, 3), 200, dtype=np.uint8)
+        assert pixelProcessing.avgPixels([], img) == (0, 0, 0)
+        assert pixelProcessing.avgPixels(np.zeros((4, 4), dtype=bool), img) == (0, 0, 0)
+
+
+class TestRegionRoutine:
+    """Test the whole-card feature extractor behind fullRoutine."""
+
+    @pytest.mark.parametrize("RGB", [True, False])
+    def test_matches_per_roi_routine(self, RGB, synthetic_card):
+        """The band extractor gives the same dict as the per-ROI loop."""
+        img = synthetic_card(np.random.default_rng(3))
+        expected = regionRoutine.fullRoutine(img, reference_filtered_pixels, {}, RGB, 3)
+        result = regionRoutine.fullRoutine(img, intensityFind.findMaxIntensitiesFiltered, {}, RGB, 3)
+        assert result == expected
+        assert list(result) == list(expected)
+
+    def test_feature_array(self, synthetic_card):
+        """extractFeatures returns one rounded colour per lane and region."""
+        img = synthetic_card(np.random.default_rng(4), (1220, 730, 3))
+        features = regionRoutine.extractFeatures(img, True, 10)
+        assert features.shape == (12, 10, 3)
+        data = regionRoutine.fullRoutine(img, intensityFind.findMaxIntensitiesFiltered, {}, True, 10)
+        assert data["C4-G"] == features[2, 3, 1]
+        assert np.array_equal(features, np.floor(features))
+
+    def test_feature_sets_match_single_runs(self, synthetic_card):
+        """One multi-configuration pass gives the per-configuration results."""
+        img = synthetic_card(np.random.default_rng(5))
+        configs = [(3, True), (6, False), (6, True), (10, False), (10, True)]
+        featureSets = regionRoutine.extractFeatureSets(img, configs)
+        assert len(featureSets) == len(configs)
+        for (regions, RGB), features in zip(configs, featureSets):
+            assert np.array_equal(features, regionRoutine.extractFeatures(img, RGB, regions))
+
+    def test_batch_matches_single_cards(self, synthetic_card):
+        """Stacks and iterators of both card heights give per-card results."""
+        rng = np.random.default_rng(7)
+        cards = [synthetic_card(rng) for _ in range(3)]
+        cards += [synthetic_card(rng, (1220, 730, 3)) for _ in range(2)]
+        expected = np.stack([regionRoutine.extractFeatures(img, False, 6) for img in cards])
+        result = regionRoutine.extractFeaturesBatch(iter(cards), False, 6, chunkSize=2)
+        assert result.shape == (5, 12, 6, 3)
+        assert np.array_equal(result, expected)
+        stack = np.stack(cards[:3])
+        assert np.array_equal(regionRoutine.extractFeaturesBatch(stack, False, 6), expected[:3])
+
+    def test_batch_rejects_other_shapes(self):
+        """Images that are not cards are reported, like directorySearch does."""
+        with pytest.raises(ValueError):
+            regionRoutine.extractFeaturesBatch([np.zeros((100, 730, 3), dtype=np.uint8)])
+
+    def test_card_layout_is_memoized(self):
+        """Layouts are built once per region count, borders and shape."""
+        layout = regionRoutine.getCardLayout(10)
+        assert regionRoutine.getCardLayout(10, shape=(1250, 730, 3)) is layout
+        assert regionRoutine.getCardLayout(10, shape=(1220, 730, 3)) is not layout
+        assert layout.laneBounds[0] == regionRoutine.laneBounds(1)
+        assert layout.regionBounds[3] == regionRoutine.regionGen(10, 3)
+        assert list(layout.regionStarts) == [start - layout.bandStart for start, _ in layout.regionBounds]
+        with pytest.raises(ValueError):
+            regionRoutine.getCardLayout(10, shape=(500, 730))
@@ -0,0 +1,182 @@
+"""Test the on-disk metadata cache against a local stand-in for the PAD API."""
+
+import pytest
+import sys
+import os
+import json
+from http.server import BaseHTTPRequestHandler
+
+# Add src to path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pad_analytics import padanalytics, metadata_cache
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """Serves cards and models with ETags, answering 304 when they match."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("If-None-Match")))
+        if self.path.startswith("/api/v2/cards/"):
+            card_id = int(self.path.rsplit("/", 1)[1])
+            data = {"id": card_id, "sample_name": "Amoxicillin", "padding": "x" * 2000}
+        elif self.path.startswith("/api-ld/v3/cards/by-sample/"):
+            sample_id = int(self.path.rsplit("/", 1)[1])
+            if sample_id == 404:
+                body = json.dumps({"success": False, "error": "no such sample"}).encode()
+                self.send_response(404)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            # the sample has no cards until version 2
+            if self.server.version < 2:
+                data = {"success": False, "error": "no cards yet"}
+            else:
+                data = {"success": True, "data": []}
+        elif self.path.startswith("/api/v2/neural-networks/"):
+            data = {"id": 18, "type": "tf_lite", "labels": ["0", "50", "100"]}
+        else:
+            self.send_error(404)
+            return
+        etag = f'"v{self.server.version}-{self.path}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(stand_in_server):
+    return stand_in_server(ApiHandler)
+
+
+@pytest.fixture
+def cache_file(tmp_path):
+    return str(tmp_path / "metadata.sqlite")
+
+
+class TestMetadataCache:
+    """Test TTLs, revalidation, eviction and offline mode."""
+
+    def test_off_by_default(self, server, monkeypatch):
+        monkeypatch.delenv("PAD_METADATA_CACHE", raising=False)
+        metadata_cache.disable_metadata_cache()
+        padanalytics.get_card(1)
+        padanalytics.get_card(1)
+        assert len(server.requests) == 2
+
+    def test_fresh_responses_are_reused(self, server, cache_file):
+        cache = metadata_cache.enable_metadata_cache(cache_file)
+        first = padanalytics.get_card(1)
+        second = padanalytics.get_card(1)
+        padanalytics.get_model(18)
+        assert first.equals(second)
+        assert [path for path, _ in server.requests] == ["/api/v2/cards/1", "/api/v2/neural-networks/18"]
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    def test_persists_across_sessions(self, server, cache_file):
+        metadata_cache.enable_metadata_cache(cache_file)
+        padanalytics.get_card(1)
+        cache = metadata_cache.enable_metadata_cache(cache_file)
+        assert padanalytics.get_card(1).id.tolist() == [1]
+        assert len(server.requests) == 1
+        assert cache.hits == 1
+
+    def test_stale_responses_are_revalidated(self, server, cache_file):
+        cache = metadata_cache.enable_metadata_cache(cache_file, ttls={"cards": 0})
+        padanalytics.get_card(1)
+        assert padanalytics.get_card(1).id.tolist() == [1]
+        assert server.requests[1] == ("/api/v2/cards/1", '"v1-/api/v2/cards/1"')
+        assert cache.revalidated == 1
+
+        # a changed resource is downloaded again
+        server.version = 2
+        padanalytics.get_card(1)
+        assert cache.misses == 2
+
+    def test_offline_mode(self, server, cache_file, capsys):
+        metadata_cache.enable_metadata_cache(cache_file, ttls={"cards": 0})
+        padanalytics.get_card(1)
+        metadata_cache.set_offline()
+        assert padanalytics.get_card(1).id.tolist() == [1]
+        assert padanalytics.get_card(2) is None
+        assert "not in the metadata cache" in capsys.readouterr().out
+        assert len(server.requests) == 1
+
+    def test_size_bounded_eviction(self, server, cache_file):
+        cache = metadata_cache.enable_metadata_cache(cache_file, max_bytes=200)
+        for card_id in (1, 2, 3):
+            padanalytics.get_card(card_id)
+        padanalytics.get_card(3)
+        assert cache.hits == 1
+        padanalytics.get_card(1)
+        assert cache.misses == 4
+
+    def test_enabled_from_environment(self, server, cache_file, monkeypatch):
+        monkeypatch.setenv("PAD_METADATA_CACHE", cache_file)
+        monkeypatch.setenv("PAD_OFFLINE", "1")
+        monkeypatch.setattr(metadata_cache, "_cache_checked", False)
+        monkeypatch.setattr(metadata_cache, "_cache", None)
+        cache = metadata_cache.get_cache()
+        assert cache.path == cache_file
+        assert cache.offline
+
+    def test_offline_from_environment_enables_cache(self, server, tmp_path, monkeypatch):
+        """PAD_OFFLINE alone turns on the default cache instead of going online."""
+        monkeypatch.delenv("PAD_METADATA_CACHE", raising=False)
+        monkeypatch.setenv("PAD_OFFLINE", "1")
+        monkeypatch.setenv("HOME", str(tmp_path))
+        monkeypatch.setattr(metadata_cache, "_cache_checked", False)
+        monkeypatch.setattr(metadata_cache, "_cache", None)
+        cache = metadata_cache.get_cache()
+        assert cache.path == metadata_cache.default_path()
+        assert cache.path.startswith(str(tmp_path))
+        assert cache.offline
+        assert padanalytics.get_card(1) is None
+        assert server.requests == []
+
+    def test_failed_sample_lookups_are_not_cached(self, server, cache_file):
+        cache = metadata_cache.enable_metadata_cache(cache_file)
+        with pytest.raises(Exception, match="API request failed: no cards yet"):
+            padanalytics.get_card_by_sample_id(7)
+        server.version = 2
+        assert padanalytics.get_card_by_sample_id(7).empty
+        assert padanalytics.get_card_by_sample_id(7).empty
+        assert len(server.requests) == 2
+        assert cache.hits == 1
+
+    def test_error_status_keeps_api_error(self, server, cache_file):
+        """A JSON error body gives the API error, with or without the cache."""
+        for enabled in (False, True):
+            if enabled:
+                metadata_cache.enable_metadata_cache(cache_file)
+            with pytest.raises(Exception, match="API request failed: no such sample"):
+                padanalytics.get_card_by_sample_id(404)
+        with pytest.raises(Exception, match="no such sample"):
+            padanalytics.get_card_by_sample_id(404)
+        assert len(server.requests) == 3
+
+    def test_endpoints(self):
+        assert metadata_cache.endpoint("https://pad.crc.nd.edu/api/v2/cards/19208") == "cards"
+        assert metadata_cache.endpoint("https://pad.crc.nd.edu/api/v2/projects/3/cards") == "project_cards"
+        assert metadata_cache.endpoint("https://pad.crc.nd.edu/api/v2/projects") == "projects"
+        assert metadata_cache.endpoint("https://pad.crc.nd.edu/api/v2/neural-networks/18") == "models"
+        assert metadata_cache.endpoint("https://pad.crc.nd.edu/api/v2/cards/issues") == "card_listings"
+        assert metadata_cache.endpoint("https://pad.crc.nd.edu/api-ld/v3/cards/by-sample/65490") == "card_listings"
+        assert metadata_cache.endpoint("https://pad.crc.nd.edu/api/v2/cards/19208/issues") == "cards"
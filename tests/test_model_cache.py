@@ -0,0 +1,109 @@
+"""Test the local model file cache."""
+
+import pytest
+import sys
+import os
+import threading
+import zipfile
+from pathlib import Path
+from unittest.mock import patch
+
+# Add src to path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pad_analytics import model_cache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """Point the model cache at an empty temporary directory."""
+    directory = tmp_path / "cache"
+    monkeypatch.setenv("PAD_MODEL_CACHE", str(directory))
+    return directory
+
+
+@pytest.fixture
+def model_url(tmp_path):
+    """A file:// URL of a model file with labels.txt appended as a zip."""
+    path = tmp_path / "server" / "model_v1.tflite"
+    path.parent.mkdir()
+    path.write_bytes(b"TFL3" + bytes(range(256)) * 64)
+    with zipfile.ZipFile(path, "a") as zf:
+        zf.writestr("labels.txt", "0\n20\n50\n")
+    return Path(path).as_uri()
+
+
+class TestModelCache:
+    """Test downloads, the manifest and warm starts."""
+
+    def test_download_and_manifest(self, cache, model_url):
+        path = model_cache.ensure_model(18, model_url, "tf_lite")
+        assert os.path.dirname(path) == str(cache)
+        assert path.endswith(".tflite")
+        entry = model_cache.read_manifest()["18"]
+        assert entry["url"] == model_url
+        assert entry["type"] == "tf_lite"
+        assert entry["labels"] == ["0", "20", "50"]
+        assert os.path.basename(path) == entry["sha256"] + ".tflite"
+        assert not [name for name in os.listdir(cache) if name.endswith((".part", ".tmp"))]
+
+    def test_warm_start_does_not_download(self, cache, model_url):
+        path = model_cache.ensure_model(18, model_url)
+        with patch("urllib.request.urlopen", side_effect=AssertionError("downloaded")):
+            assert model_cache.ensure_model(18, model_url) == path
+
+    def test_changed_url_or_missing_file_downloads_again(self, cache, model_url):
+        path = model_cache.ensure_model(18, model_url)
+        os.unlink(path)
+        assert model_cache.cached_model(18) is None
+        assert model_cache.ensure_model(18, model_url) == path
+        assert model_cache.cached_model(18, model_url + "?v=2") is None
+
+    def test_same_weights_share_a_file(self, cache, model_url):
+        """Files are content addressed, so two ids can share one file."""
+        assert model_cache.ensure_model(18, model_url) == model_cache.ensure_model(19, model_url)
+        assert set(model_cache.read_manifest()) == {"18", "19"}
+
+    def test_concurrent_workers_download_once(self, cache, model_url):
+        urlopen = model_cache.urllib.request.urlopen
+        calls = []
+
+        def counting_urlopen(url):
+            calls.append(url)
+            return urlopen(url)
+
+        paths = []
+        with patch("urllib.request.urlopen", side_effect=counting_urlopen):
+            threads = [
+                threading.Thread(target=lambda: paths.append(model_cache.ensure_model(18, model_url)))
+                for _ in range(6)
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        assert len(calls) == 1
+        assert len(set(paths)) == 1 and len(paths) == 6
+
+    def test_failed_download_leaves_nothing(self, cache, model_url):
+        with pytest.raises(OSError):
+            model_cache.ensure_model(18, model_url.replace("model_v1", "missing"))
+        assert model_cache.read_manifest() == {}
+        assert [name for name in os.listdir(cache) if not name.endswith(".lock")] == []
+
+    def test_clear(self, cache, model_url):
+        model_cache.ensure_model(18, model_url)
+        model_cache.clear_model_cache()
+        assert model_cache.read_manifest() == {}
+        assert model_cache.cached_model(18) is None
+
+
+class TestLabels:
+    """Test labels read from model files in memory."""
+
+    def test_read_labels(self, tmp_path, model_url, cache):
+        path = model_cache.ensure_model(18, model_url)
+        assert model_cache.read_labels(path) == ["0", "20", "50"]
+        plain = tmp_path / "coefficients.csv"
+        plain.write_text("albendazole,1,2\n")
+        assert model_cache.read_labels(str(plain)) is None
@@ -0,0 +1,544 @@
+"""Test the shared TFLite interpreters behind the neural network predictions."""
+
+import pytest
+import sys
+import os
+import threading
+import zipfile
+import numpy as np
+from PIL import Image
+from unittest.mock import patch
+
+# Add src to path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pad_analytics import padanalytics, pad_analysis, nn_inference
+
+LABELS = ["0", "20", "50", "80", "100"]
+
+
+def build_model(path, batch=None, size=454, seed=0, quantized=None):
+    """Write a small classifier with the input and output layout of the PAD models.
+
+    The labels are appended as labels.txt in a zip, like the metadata of the
+    published models. quantized ("int8" or "uint8") gives a fully integer
+    quantized model with inputs and outputs of that type.
+    """
+    import tensorflow as tf
+
+    rng = np.random.default_rng(seed)
+    weights = tf.constant(rng.normal(0, 0.05, (3, len(LABELS))), dtype=tf.float32)
+    bias = tf.constant(rng.normal(0, 1, len(LABELS)), dtype=tf.float32)
+
+    @tf.function(input_signature=[tf.TensorSpec([batch, size, size, 3], tf.float32)])
+    def classify(images):
+        return tf.matmul(tf.reduce_mean(images, axis=[1, 2]), weights) + bias
+
+    converter = tf.lite.TFLiteConverter.from_concrete_functions(
+        [classify.get_concrete_function()], classify
+    )
+    if quantized:
+        def representative_dataset():
+            for i in range(8):
+                images = np.random.default_rng(i).uniform(0, 255, (1, size, size, 3))
+                yield [images.astype(np.float32)]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = getattr(tf, quantized)
+        converter.inference_output_type = getattr(tf, quantized)
+    with open(path, "wb") as f:
+        f.write(converter.convert())
+    with zipfile.ZipFile(path, "a") as zf:
+        zf.writestr("labels.txt", "".join(label + "\n" for label in LABELS))
+    return str(path)
+
+
+def reference_outputs(model_path, images):
+    """Run each image through a freshly created interpreter, as before."""
+    import tensorflow as tf
+
+    outputs = []
+    for im in images:
+        interpreter = tf.lite.Interpreter(model_path=model_path)
+        interpreter.allocate_tensors()
+        interpreter.set_tensor(interpreter.get_input_details()[0]["index"], im[None])
+        interpreter.invoke()
+        outputs.append(interpreter.get_tensor(interpreter.get_output_details()[0]["index"])[0])
+    return np.array(outputs)
+
+
+def card_image(seed):
+    """Random RGB card image with the size of the processed PAD photos."""
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, (1250, 730, 3), dtype=np.uint8))
+
+
+def legacy_input(img):
+    """Crop, resize and cast a card like the original nn_predict."""
+    img = img.crop((71, 359, 71 + 636, 359 + 490)).resize((454, 454), Image.BICUBIC)
+    return np.asarray(img).astype(np.float32)
+
+
+@pytest.fixture(scope="module")
+def model_file(tmp_path_factory):
+    return build_model(tmp_path_factory.mktemp("models") / "model.tflite")
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    nn_inference.clear_interpreter_cache()
+    yield
+    nn_inference.clear_interpreter_cache()
+
+
+class TestInterpreterPool:
+    """Test the interpreter registry and per-model pools."""
+
+    def test_pool_is_shared(self, model_file):
+        """The same model file gives the same pool and reuses interpreters."""
+        pool = nn_inference.get_interpreter_pool(model_file)
+        assert nn_inference.get_interpreter_pool(model_file) is pool
+        with pool.interpreter() as first:
+            pass
+        with pool.interpreter() as second:
+            assert second is first
+            with pool.interpreter() as other:
+                assert other is not first
+
+    def test_replaced_file_gets_new_pool(self, tmp_path):
+        """A model file with new content is not served from the old pool."""
+        path = build_model(tmp_path / "model.tflite", seed=1)
+        pool = nn_inference.get_interpreter_pool(path)
+        build_model(tmp_path / "model.tflite", seed=2)
+        os.utime(path, ns=(1, 1))
+        assert nn_inference.get_interpreter_pool(path) is not pool
+
+    def test_lru_eviction(self, tmp_path, monkeypatch):
+        """Models beyond MAX_CACHED_MODELS are evicted, oldest first."""
+        monkeypatch.setattr(nn_inference, "MAX_CACHED_MODELS", 2)
+        paths = [build_model(tmp_path / f"m{i}.tflite", seed=i) for i in range(3)]
+        pools = [nn_inference.get_interpreter_pool(p) for p in paths[:2]]
+        nn_inference.get_interpreter_pool(paths[0])
+        nn_inference.get_interpreter_pool(paths[2])
+        assert nn_inference.get_interpreter_pool(paths[0]) is pools[0]
+        assert nn_inference.get_interpreter_pool(paths[1]) is not pools[1]
+
+    def test_threads_share_pool(self, model_file):
+        """Concurrent borrowers never get the same interpreter."""
+        pool = nn_inference.get_interpreter_pool(model_file)
+        barrier = threading.Barrier(4)
+        borrowed = []
+
+        def borrow():
+            with pool.interpreter() as interpreter:
+                borrowed.append(interpreter)
+                barrier.wait(timeout=10)
+
+        threads = [threading.Thread(target=borrow) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(set(map(id, borrowed))) == 4
+        assert len(pool._idle) == nn_inference.POOL_SIZE
+
+
+class TestPredictions:
+    """Test the prediction entry points on top of the pools."""
+
+    def test_nn_predict_matches_fresh_interpreter(self, model_file):
+        """nn_predict gives the legacy results with pooled interpreters."""
+        img = card_image(3)
+        logits = reference_outputs(model_file, [legacy_input(img)])[0]
+        with patch.object(padanalytics, "read_img", return_value=img):
+            for _ in range(2):
+                prediction, probability, energy = padanalytics.nn_predict(
+                    "http://example.com/card.png", model_file, LABELS
+                )
+                assert prediction == LABELS[np.argmax(logits)]
+                exps = np.exp(logits - logits.max())
+                assert probability == pytest.approx(exps.max() / exps.sum(), rel=1e-5)
+                assert energy == pytest.approx(logits.max() + np.log(exps.sum()), rel=1e-5)
+
+    def test_catagorize(self, model_file, tmp_path, monkeypatch):
+        """pad_neural_network labels a card with the pooled interpreters."""
+        monkeypatch.chdir(tmp_path)
+        img = card_image(4)
+        img.save("card.png")
+        logits = reference_outputs(model_file, [legacy_input(img)])[0]
+        nn = pad_analysis.pad_neural_network(model_file)
+        assert nn.pool is nn_inference.get_interpreter_pool(model_file)
+        concentration, confidence = nn.catagorize("card.png")
+        assert concentration == LABELS[np.argmax(logits)]
+        exps = np.exp(logits)
+        assert confidence == pytest.approx(exps.max() / exps.sum(), rel=1e-5)
+
+    def test_labels_read_in_memory(self, model_file, tmp_path, monkeypatch):
+        """pad_neural_network no longer extracts labels.txt into the cwd."""
+        monkeypatch.chdir(tmp_path)
+        nn = pad_analysis.pad_neural_network(model_file)
+        assert nn.labels == [label + "\n" for label in LABELS]
+        assert not os.path.exists(tmp_path / "labels.txt")
+
+
+class TestBatchInference:
+    """Test batched invokes against per-card reference outputs."""
+
+    def test_dynamic_batch(self, model_file):
+        """A model with a dynamic batch runs several cards per invoke."""
+        pool = nn_inference.get_interpreter_pool(model_file)
+        assert pool.batchable
+        inputs = np.stack([legacy_input(card_image(seed)) for seed in range(5)])
+        outputs = nn_inference.invoke_batch(pool, inputs, batch_size=2)
+        np.testing.assert_allclose(outputs, reference_outputs(model_file, inputs), rtol=1e-5)
+        # the pooled interpreter keeps working for single inputs afterwards
+        single = nn_inference.invoke_batch(pool, inputs[:1])
+        np.testing.assert_allclose(single, outputs[:1], rtol=1e-5)
+
+    def test_fixed_batch_falls_back(self, tmp_path):
+        """A model with a fixed batch of one is fed one card at a time."""
+        path = build_model(tmp_path / "fixed.tflite", batch=1)
+        pool = nn_inference.get_interpreter_pool(path)
+        assert not pool.batchable
+        inputs = np.stack([legacy_input(card_image(seed)) for seed in range(3)])
+        outputs = nn_inference.invoke_batch(pool, inputs)
+        np.testing.assert_allclose(outputs, reference_outputs(path, inputs), rtol=1e-5)
+
+    def test_failed_resize_falls_back(self, model_file):
+        """A dynamic-batch model that fails to resize is fed one card at a time."""
+        import tensorflow as tf
+
+        class UnresizableInterpreter(tf.lite.Interpreter):
+            def resize_tensor_input(self, index, shape, strict=False):
+                if shape[0] > 1:
+                    raise RuntimeError("cannot resize")
+                super().resize_tensor_input(index, shape, strict=strict)
+
+        images = [card_image(seed) for seed in range(5)]
+        expected = nn_inference.invoke_cards(nn_inference.get_interpreter_pool(model_file), images, 4)
+        nn_inference.set_backend(UnresizableInterpreter)
+        try:
+            pool = nn_inference.get_interpreter_pool(model_file)
+            assert pool.batchable
+            outputs = nn_inference.invoke_cards(pool, iter(images), 4)
+            assert not pool.batchable
+        finally:
+            nn_inference.set_backend(None)
+        np.testing.assert_allclose(outputs, expected, rtol=1e-5)
+
+    def test_empty_batch(self, model_file):
+        pool = nn_inference.get_interpreter_pool(model_file)
+        assert nn_inference.invoke_batch(pool, np.zeros((0, 454, 454, 3))).shape == (0, len(LABELS))
+
+    def test_nn_predict_batch(self, model_file):
+        """nn_predict_batch gives the nn_predict result of every card."""
+        images = [card_image(seed) for seed in range(3)]
+        predictions, probabilities, energies = padanalytics.nn_predict_batch(images, model_file, LABELS)
+        for img, prediction, probability, energy in zip(images, predictions, probabilities, energies):
+            with patch.object(padanalytics, "read_img", return_value=img):
+                expected = padanalytics.nn_predict("http://example.com/card.png", model_file, LABELS)
+            assert prediction == expected[0]
+            assert probability == pytest.approx(expected[1], rel=1e-5)
+            assert energy == pytest.approx(expected[2], rel=1e-5)
+
+    def test_catagorize_batch(self, model_file, tmp_path, monkeypatch):
+        """catagorize_batch matches catagorize card by card."""
+        monkeypatch.chdir(tmp_path)
+        files = []
+        for seed in range(3):
+            card_image(seed).save(f"card{seed}.png")
+            files.append(f"card{seed}.png")
+        nn = pad_analysis.pad_neural_network(model_file)
+        concentrations, confidences = nn.catagorize_batch(files, batch_size=2)
+        for im_file, concentration, confidence in zip(files, concentrations, confidences):
+            expected = nn.catagorize(im_file)
+            assert concentration == expected[0]
+            assert confidence == pytest.approx(expected[1], rel=1e-5)
+
+
+class TestPreprocessing:
+    """Test card preprocessing straight into model input buffers."""
+
+    def test_card_input_matches_legacy(self):
+        """Filling a buffer gives the same input as the legacy copies."""
+        img = card_image(5)
+        buffer = np.zeros((2, 454, 454, 3), dtype=np.float32)
+        row = buffer[1]
+        assert nn_inference.card_input(img, out=row) is row
+        assert np.array_equal(buffer[1], legacy_input(img))
+        assert np.array_equal(nn_inference.card_input(img), legacy_input(img))
+
+    def test_invoke_cards(self, model_file):
+        """Cards streamed into the input tensor give the reference outputs."""
+        images = [card_image(seed) for seed in range(5)]
+        pool = nn_inference.get_interpreter_pool(model_file)
+        outputs = nn_inference.invoke_cards(pool, iter(images), batch_size=2)
+        expected = reference_outputs(model_file, [legacy_input(img) for img in images])
+        np.testing.assert_allclose(outputs, expected, rtol=1e-5)
+        assert nn_inference.invoke_cards(pool, []).shape == (0, len(LABELS))
+
+
+class TestPostprocessing:
+    """Test the NumPy post-processing of model outputs."""
+
+    def test_matches_tensorflow(self):
+        """Softmax and energy agree with the TensorFlow ops used before."""
+        import tensorflow as tf
+
+        logits = np.random.default_rng(8).normal(0, 4, (6, 5)).astype(np.float32)
+        np.testing.assert_allclose(nn_inference.softmax(logits), tf.nn.softmax(logits).numpy(), rtol=1e-5)
+        np.testing.assert_allclose(
+            nn_inference.logsumexp(logits), tf.reduce_logsumexp(logits, -1).numpy(), rtol=1e-5
+        )
+
+    def test_stable_for_large_logits(self):
+        logits = np.array([[1000.0, 999.0, -1000.0]])
+        assert np.isfinite(nn_inference.softmax(logits)).all()
+        assert nn_inference.logsumexp(logits)[0] == pytest.approx(1000 + np.log1p(np.exp(-1)))
+
+    def test_softmaxed_outputs_kept(self):
+        """Rows that already sum to one are used as probabilities."""
+        outputs = np.array([[0.1, 0.7, 0.2], [2.0, 0.5, -1.0]])
+        best, probabilities, energies = nn_inference.postprocess(outputs)
+        assert best.tolist() == [1, 0]
+        assert probabilities[0] == pytest.approx(0.7)
+        assert probabilities[1] == pytest.approx(nn_inference.softmax(outputs[1])[0])
+        assert energies[1] == pytest.approx(np.log(np.exp(outputs[1]).sum()))
+
+    def test_top_k(self):
+        scores = np.array([[0.1, 0.5, 0.3, 0.9], [4.0, 3.0, 2.0, 1.0]])
+        indices, values = nn_inference.top_k(scores, 2)
+        assert indices.tolist() == [[3, 1], [0, 1]]
+        assert values.tolist() == [[0.9, 0.5], [4.0, 3.0]]
+        assert nn_inference.top_k(scores, 10)[0].shape == (2, 4)
+
+
+class TestBackend:
+    """Test the choice of interpreter backend."""
+
+    @pytest.fixture(autouse=True)
+    def reset_backend(self):
+        yield
+        nn_inference.set_backend(None)
+
+    def test_tensorflow_not_imported_by_package(self):
+        """Importing the package does not pull in TensorFlow."""
+        import subprocess
+
+        code = "import sys, pad_analytics; print('tensorflow' in sys.modules)"
+        env = dict(os.environ, PYTHONPATH=os.path.join(os.path.dirname(__file__), '..', 'src'))
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+        assert result.stdout.strip().splitlines()[-1] == "False"
+
+    def test_first_installed_backend(self, monkeypatch):
+        """Missing backends are skipped in order."""
+        monkeypatch.setattr(nn_inference, "BACKENDS", {
+            "missing": ("pad_analytics_missing_backend", "Interpreter"),
+            "tensorflow": ("tensorflow", "lite.Interpreter"),
+        })
+        nn_inference.set_backend(None)
+        name, interpreter_class = nn_inference.get_backend()
+        assert name == "tensorflow"
+        assert interpreter_class.__name__ == "Interpreter"
+
+    def test_requested_backend(self, monkeypatch):
+        monkeypatch.setenv("PAD_TFLITE_BACKEND", "tflite_runtime")
+        monkeypatch.setattr(nn_inference, "BACKENDS", {"tflite_runtime": ("pad_analytics_missing_backend", "Interpreter")})
+        nn_inference.set_backend(None)
+        with pytest.raises(ImportError):
+            nn_inference.get_backend()
+        with pytest.raises(ValueError):
+            nn_inference.set_backend("caffe")
+
+    def test_custom_interpreter_class(self, model_file):
+        """Any class with the tf.lite.Interpreter interface can be plugged in."""
+        import tensorflow as tf
+
+        created = []
+
+        class RecordingInterpreter(tf.lite.Interpreter):
+            def __init__(self, model_path):
+                created.append(model_path)
+                super().__init__(model_path=model_path)
+
+        nn_inference.set_backend(RecordingInterpreter)
+        pool = nn_inference.get_interpreter_pool(model_file)
+        assert created == [os.path.abspath(model_file)]
+        outputs = nn_inference.invoke_cards(pool, [card_image(0)])
+        assert outputs.shape == (1, len(LABELS))
+
+
+class TestPreload:
+    """Test warming up models before the first prediction."""
+
+    def test_preload_models(self, model_file, tmp_path, monkeypatch):
+        """Models are cached, loaded and invoked once, with timings per model."""
+        import pandas as pd
+        from pathlib import Path
+
+        monkeypatch.setenv("PAD_MODEL_CACHE", str(tmp_path / "cache"))
+        coefficients = tmp_path / "pls.csv"
+        coefficients.write_text("albendazole," + ",".join(["0.5"] * 361) + "\n")
+        models = {
+            18: {"type": "tf_lite", "weights_url": Path(model_file).as_uri(), "labels": LABELS},
+            19: {"type": "pls", "weights_url": coefficients.as_uri(), "labels": ["albendazole"]},
+        }
+
+        def get_model(model_id):
+            if model_id not in models:
+                return None
+            return pd.json_normalize(models[model_id])
+
+        monkeypatch.setattr(padanalytics, "get_model", get_model)
+        timings = padanalytics.preload_models([18, 19, 404])
+
+        assert timings.model_id.tolist() == [18, 19, 404]
+        assert timings.type.tolist()[:2] == ["tf_lite", "pls"]
+        assert timings.error.isna().tolist() == [True, True, False]
+        assert (timings.total_s > 0).all()
+        assert timings.loc[:1, ["metadata_s", "download_s", "load_s", "warmup_s"]].notna().all().all()
+
+        pool = nn_inference.get_interpreter_pool(timings.model_file[0])
+        assert os.path.dirname(pool.model_path) == str(tmp_path / "cache")
+        assert padanalytics.preload_models([]).columns[0] == "model_id"
+
+
+class TestQuantizedModels:
+    """Test int8 and uint8 models, quantized on the way in and out."""
+
+    @staticmethod
+    def reference_quantized(model_path, images):
+        """Quantize, invoke and dequantize by hand on a fresh interpreter."""
+        import tensorflow as tf
+
+        interpreter = tf.lite.Interpreter(model_path=model_path)
+        interpreter.allocate_tensors()
+        input_details = interpreter.get_input_details()[0]
+        output_details = interpreter.get_output_details()[0]
+        scale, zero_point = input_details["quantization"]
+        limits = np.iinfo(input_details["dtype"])
+        outputs = []
+        for im in images:
+            q = np.clip(np.round(im / scale) + zero_point, limits.min, limits.max)
+            interpreter.set_tensor(input_details["index"], q.astype(input_details["dtype"])[None])
+            interpreter.invoke()
+            out = interpreter.get_tensor(output_details["index"])[0]
+            out_scale, out_zero_point = output_details["quantization"]
+            outputs.append((out.astype(np.float32) - out_zero_point) * out_scale)
+        return np.array(outputs)
+
+    @pytest.mark.parametrize("quantized", ["int8", "uint8"])
+    def test_quantized_model(self, tmp_path, quantized):
+        path = build_model(tmp_path / f"{quantized}.tflite", quantized=quantized)
+        pool = nn_inference.get_interpreter_pool(path)
+        assert pool.input_details[0]["dtype"] == np.dtype(quantized)
+
+        images = [card_image(seed) for seed in range(3)]
+        inputs = [legacy_input(img) for img in images]
+        expected = self.reference_quantized(path, inputs)
+        outputs = nn_inference.invoke_cards(pool, images)
+        assert outputs.dtype == np.float32
+        np.testing.assert_allclose(outputs, expected, rtol=1e-6)
+        np.testing.assert_allclose(nn_inference.invoke_batch(pool, np.stack(inputs)), expected, rtol=1e-6)
+
+        # close to the float model it was quantized from
+        float_outputs = reference_outputs(build_model(tmp_path / "float.tflite"), inputs)
+        np.testing.assert_allclose(outputs, float_outputs, atol=0.25)
+
+        with patch.object(padanalytics, "read_img", return_value=images[0]):
+            prediction, probability, _ = padanalytics.nn_predict("http://example.com/card.png", path, LABELS)
+        assert prediction == LABELS[np.argmax(expected[0])]
+        assert probability == pytest.approx(nn_inference.softmax(expected[0]).max(), rel=1e-5)
+
+    def test_quantize_round_trip(self):
+        values = np.array([0.0, 1.0, 127.0, 128.0, 255.0])
+        q = nn_inference.quantize(values, np.int8, (1.0, -128))
+        assert q.tolist() == [-128, -127, -1, 0, 127]
+        assert nn_inference.dequantize(q, (1.0, -128)).tolist() == values.tolist()
+        assert nn_inference.quantize(values, np.uint8, (0.0, 0)).tolist() == values.tolist()
+        floats = np.ones(3, dtype=np.float32)
+        assert nn_inference.dequantize(floats, (0.0, 0)) is floats
+
+
+class TestThreads:
+    """Test interpreter thread settings and the benchmark."""
+
+    @pytest.fixture(autouse=True)
+    def reset_threads(self, model_file):
+        yield
+        nn_inference.set_num_threads(None)
+        nn_inference.set_num_threads(None, model_file)
+        nn_inference.set_backend(None)
+
+    def test_threads_from_environment(self, monkeypatch):
+        monkeypatch.setenv("PAD_TFLITE_THREADS", "3")
+        assert nn_inference._threads_from_env() == 3
+        monkeypatch.setenv("PAD_TFLITE_THREADS", "0")
+        assert nn_inference._threads_from_env() is None
+        monkeypatch.setenv("PAD_TFLITE_THREADS", "auto")
+        with pytest.warns(UserWarning, match="PAD_TFLITE_THREADS"):
+            assert nn_inference._threads_from_env() is None
+
+    def test_bad_thread_setting_does_not_break_import(self):
+        import subprocess
+
+        code = "import pad_analytics.nn_inference as m; print(m.NUM_THREADS)"
+        env = dict(
+            os.environ,
+            PAD_TFLITE_THREADS="auto",
+            PYTHONPATH=os.path.join(os.path.dirname(__file__), '..', 'src'),
+        )
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip() == "None"
+
+    def test_thread_settings(self, model_file):
+        """Global and per-model thread counts reach new interpreters."""
+        import tensorflow as tf
+
+        created = []
+
+        class RecordingInterpreter(tf.lite.Interpreter):
+            def __init__(self, model_path, **kwargs):
+                created.append(kwargs.get("num_threads"))
+                super().__init__(model_path=model_path, **kwargs)
+
+        nn_inference.set_backend(RecordingInterpreter)
+        default = nn_inference.get_interpreter_pool(model_file)
+        nn_inference.set_num_threads(2)
+        assert nn_inference.get_num_threads(model_file) == 2
+        two = nn_inference.get_interpreter_pool(model_file)
+        nn_inference.set_num_threads(1, model_file)
+        one = nn_inference.get_interpreter_pool(model_file)
+        assert created == [None, 2, 1]
+        assert default is not two and two is not one
+        assert one.num_threads == 1
+        assert nn_inference.invoke_cards(one, [card_image(0)]).shape == (1, len(LABELS))
+
+    @pytest.mark.parametrize("cores, workers, expected", [
+        (1, None, (1, 1)),
+        (8, None, (4, 2)),
+        (64, None, (16, 4)),
+        (8, 2, (2, 4)),
+        (4, 8, (8, 1)),
+    ])
+    def test_suggest_thread_split(self, cores, workers, expected):
+        assert nn_inference.suggest_thread_split(workers, cores) == expected
+
+    def test_benchmark(self, model_file, tmp_path):
+        timings = nn_inference.benchmark_threads(model_file, [1, 2], [1, 2], cards=3)
+        assert list(timings.columns) == ["num_threads", "batch_size", "seconds", "cards_per_s"]
+        assert timings[["num_threads", "batch_size"]].values.tolist() == [[1, 1], [1, 2], [2, 1], [2, 2]]
+        assert (timings.cards_per_s > 0).all()
+
+        fixed = build_model(tmp_path / "fixed.tflite", batch=1)
+        assert nn_inference.benchmark_threads(fixed, [1], [1, 4], cards=2).batch_size.tolist() == [1]
+
+    def test_benchmark_command(self, model_file, monkeypatch, capsys):
+        monkeypatch.setattr(sys, "argv", ["nn_inference", model_file, "--threads", "1", "--cards", "2"])
+        nn_inference.main()
+        output = capsys.readouterr().out
+        assert "Suggested split" in output
+        assert "cards_per_s" in output
@@ -15,7 +15,7 @@ import pad_analytics
 class TestPadAnalytics:
     """Test core padanalytics functions."""
     
-    @patch('pad_analytics.padanalytics.requests.get')
+    @patch('pad_analytics.http_client.get')
     def test_get_projects_success(self, mock_get):
         """Test get_projects function with successful API response."""
         # Mock successful API response
@@ -35,7 +35,7 @@ class TestPadAnalytics:
         assert "id" in result.columns
         assert "name" in result.columns
     
-    @patch('pad_analytics.padanalytics.requests.get')
+    @patch('pad_analytics.http_client.get')
     def test_get_projects_api_error(self, mock_get):
         """Test get_projects function with API error."""
         # Mock API error
@@ -49,7 +49,7 @@ class TestPadAnalytics:
         assert isinstance(result, pd.DataFrame)
         assert len(result) == 0
     
-    @patch('pad_analytics.padanalytics.requests.get')
+    @patch('pad_analytics.http_client.get')
     def test_get_card_success(self, mock_get):
         """Test get_card function with successful response."""
         card_id = 12345
@@ -123,6 +123,87 @@ class TestModelPrediction:
             padanalytics.predict(-1, 18)
 
 
+class TestMetadataMemo:
+    """Test that predictions fetch card and model metadata only once."""
+
+    @pytest.fixture
+    def calls(self, monkeypatch):
+        """Count get_card and get_model calls, with predictions stubbed out."""
+        module = pad_analytics.padanalytics
+        calls = {"card": [], "model": []}
+
+        def get_card(card_id):
+            calls["card"].append(card_id)
+            if card_id < 0:
+                return None
+            return pd.DataFrame([{
+                "id": card_id,
+                "sample_name": "Amoxicillin",
+                "quantity": 50.0,
+                "processed_file_location": f"card_{card_id}.png",
+            }])
+
+        def get_model(model_id):
+            calls["model"].append(model_id)
+            return pd.json_normalize({
+                "type": "tf_lite",
+                "weights_url": "https://pad.crc.nd.edu/model.tflite",
+                "labels": ["amoxicillin", "lactose"],
+            })
+
+        monkeypatch.setattr(module, "get_card", get_card)
+        monkeypatch.setattr(module, "get_model", get_model)
+        monkeypatch.setattr(module.model_cache, "ensure_model", lambda *args: "model.tflite")
+        monkeypatch.setattr(module, "nn_predict", lambda url, model_file, labels: (labels[0], 0.9, 1.0))
+        yield calls
+        module.disable_metadata_memo()
+
+    def test_predict_fetches_model_once(self, calls):
+        actual, prediction = pad_analytics.predict(7, 16)
+        assert actual == "amoxicillin"
+        assert prediction[0] == "amoxicillin"
+        assert calls == {"card": [7], "model": [16]}
+
+    def test_show_prediction_fetches_metadata_once(self, calls):
+        module = pad_analytics.padanalytics
+        with patch.object(module, "create_image_widget_with_info") as widget, \
+                patch.object(module, "display"):
+            pad_analytics.show_prediction(7, 16)
+        data_df = widget.call_args[0][1]
+        assert data_df["Prediction"].tolist() == [("amoxicillin", 0.9, 1.0)]
+        assert calls == {"card": [7], "model": [16]}
+
+    def test_apply_predictions_fetches_model_once(self, calls):
+        dataset = pd.DataFrame({"id": [1, 2, 3], "sample_name": ["Amoxicillin"] * 3})
+        results = pad_analytics.apply_predictions_to_dataframe(dataset, 16)
+        assert results.id.tolist() == [1, 2, 3]
+        assert calls == {"card": [1, 2, 3], "model": [16]}
+
+        # the memo ends with the call
+        pad_analytics.predict(1, 16)
+        assert calls["model"] == [16, 16]
+
+    def test_metadata_session(self, calls):
+        with pad_analytics.metadata_session():
+            for _ in range(3):
+                pad_analytics.predict(7, 16)
+            with pad_analytics.metadata_session():
+                pad_analytics.predict(8, 16)
+            pad_analytics.predict(8, 16)
+        assert calls == {"card": [7, 8], "model": [16]}
+
+    def test_failed_lookups_are_not_memoized(self, calls):
+        pad_analytics.enable_metadata_memo()
+        for _ in range(2):
+            with pytest.raises(Exception):
+                pad_analytics.predict(-1, 16)
+        assert calls["card"] == [-1, -1]
+        pad_analytics.disable_metadata_memo()
+        pad_analytics.predict(7, 16)
+        pad_analytics.predict(7, 16)
+        assert calls["card"] == [-1, -1, 7, 7]
+
+
 class TestDataProcessing:
     """Test data processing utilities."""
     
@@ -0,0 +1,198 @@
+"""Test PLS concentration scoring."""
+
+import pytest
+import sys
+import os
+import numpy as np
+import cv2 as cv
+
+# Add src to path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pad_analytics import padanalytics, pad_analysis, regionRoutine, intensityFind, pls_model
+
+DRUGS = ["albendazole", "amoxicillin", "ciprofloxacin"]
+
+
+@pytest.fixture
+def coefficients_file(tmp_path):
+    """Write a small coefficients CSV in the format of the PLS model files."""
+    rng = np.random.default_rng(10)
+    path = tmp_path / "pls_coefficients.csv"
+    with open(path, "w") as f:
+        for drug in DRUGS:
+            row = [30.0 + rng.random()] + list(rng.normal(0, 0.05, 360))
+            f.write(drug + "," + ",".join(repr(float(v)) for v in row) + "\n")
+    return str(path)
+
+
+@pytest.fixture
+def card_file(tmp_path, synthetic_card):
+    """Write a synthetic card image to disk."""
+    img = synthetic_card(np.random.default_rng(11))
+    path = tmp_path / "card.png"
+    cv.imwrite(str(path), img)
+    return str(path), img
+
+
+def reference_quantity(coefficients_file, img, drug):
+    """The original string-keyed PLS accumulation."""
+    coeff = {}
+    with open(coefficients_file) as f:
+        for line in f:
+            row = line.strip().split(",")
+            coeff[row[0]] = [float(v) for v in row[1:]]
+    data = regionRoutine.fullRoutine(img, intensityFind.findMaxIntensitiesFiltered, {}, True, 10)
+    drug_coeff = coeff[drug]
+    concentration = drug_coeff[0]
+    coeff_index = 1
+    for letter in regionRoutine.LANE_LETTERS:
+        for region in range(10):
+            for color_letter in ["R", "G", "B"]:
+                concentration += float(data[letter + str(region + 1) + "-" + color_letter]) * drug_coeff[coeff_index]
+                coeff_index += 1
+    return concentration
+
+
+class TestFeatureVector:
+    """Test the flat float32 feature vector used for PLS."""
+
+    def test_vector_follows_column_schema(self, synthetic_card):
+        img = synthetic_card(np.random.default_rng(12))
+        vector = regionRoutine.extractFeatureVector(img, True, 10)
+        columns = regionRoutine.featureColumns(10, True)
+        assert vector.dtype == np.float32
+        assert vector.shape == (360,)
+        assert vector.flags.c_contiguous
+        assert regionRoutine.featureColumns(10, True) is columns
+        data = regionRoutine.fullRoutine(img, intensityFind.findMaxIntensitiesFiltered, {}, True, 10)
+        assert list(data) == list(columns)
+        assert [data[column] for column in columns] == vector.astype(int).tolist()
+
+
+class TestPLS:
+    """Test the pls classes of padanalytics and pad_analysis."""
+
+    @pytest.mark.parametrize("module", [padanalytics, pad_analysis])
+    def test_quantity_matches_reference(self, module, coefficients_file, card_file):
+        path, img = card_file
+        model = module.pls(coefficients_file)
+        for drug in DRUGS:
+            expected = reference_quantity(coefficients_file, img, drug)
+            assert model.quantity(path, drug.capitalize()) == pytest.approx(expected, rel=1e-9)
+
+    @pytest.mark.parametrize("module", [padanalytics, pad_analysis])
+    def test_unknown_drug(self, module, coefficients_file, card_file):
+        path, _ = card_file
+        assert module.pls(coefficients_file).quantity(path, "not-a-drug") in (-1, 0.0)
+
+    def test_quantities_scores_every_drug(self, coefficients_file, card_file):
+        path, img = card_file
+        result = padanalytics.pls(coefficients_file).quantities(path)
+        assert list(result) == DRUGS
+        for drug in DRUGS:
+            assert result[drug] == pytest.approx(reference_quantity(coefficients_file, img, drug), rel=1e-9)
+
+
+class TestPLSModel:
+    """Test the matrix-form PLS engine."""
+
+    def test_load_and_score(self, coefficients_file):
+        model = pls_model.PLSModel.from_csv(coefficients_file)
+        assert model.drugs == DRUGS
+        assert model.coefficients.shape == (3, 361)
+        assert model.n_features == 360
+        features = np.random.default_rng(13).integers(0, 256, (5, 360)).astype(np.float32)
+
+        everything = model.score(features)
+        assert everything.shape == (5, 3)
+        for i, drug in enumerate(DRUGS):
+            coeff = model.coefficients[model.drug_index[drug]]
+            expected = [coeff[0] + sum(float(v) * c for v, c in zip(row, coeff[1:])) for row in features]
+            assert np.allclose(everything[:, i], expected)
+            assert np.allclose(model.score(features, drug), expected)
+
+        several = model.score(features[0], ["ciprofloxacin", "albendazole"])
+        assert several.shape == (2,)
+        assert np.allclose(several, everything[0, [2, 0]])
+
+    def test_unknown_drug_raises(self, coefficients_file):
+        model = pls_model.PLSModel.from_csv(coefficients_file)
+        assert "paracetamol" not in model
+        with pytest.raises(KeyError):
+            model.score(np.zeros(360), "paracetamol")
+
+    def test_load_cache(self, coefficients_file, tmp_path):
+        pls_model.clear_pls_cache()
+        model = pls_model.load_pls_model(coefficients_file)
+        assert pls_model.load_pls_model(coefficients_file) is model
+        assert padanalytics.pls(coefficients_file).model is model
+        assert pad_analysis.pls(coefficients_file).model is model
+
+        # a rewritten file is parsed again
+        with open(coefficients_file, "a") as f:
+            f.write("paracetamol," + ",".join(["0.5"] * 361) + "\n")
+        reloaded = pls_model.load_pls_model(coefficients_file)
+        assert reloaded is not model
+        assert "paracetamol" in reloaded
+
+    def test_load_cache_eviction(self, coefficients_file, tmp_path, monkeypatch):
+        pls_model.clear_pls_cache()
+        monkeypatch.setattr(pls_model, "MAX_CACHED_MODELS", 2)
+        paths = []
+        for i in range(3):
+            path = tmp_path / f"coefficients_{i}.csv"
+            path.write_text(open(coefficients_file).read())
+            paths.append(str(path))
+        first = pls_model.load_pls_model(paths[0])
+        pls_model.load_pls_model(paths[1])
+        pls_model.load_pls_model(paths[2])
+        assert pls_model.load_pls_model(paths[0]) is not first
+
+
+class TestOfflineScoring:
+    """Test scoring stored feature tables without images."""
+
+    @pytest.fixture
+    def feature_table(self):
+        import pandas as pd
+
+        rng = np.random.default_rng(14)
+        columns = list(regionRoutine.featureColumns(10, True))
+        table = pd.DataFrame(rng.integers(0, 256, (7, 360)), columns=columns, index=range(100, 107))
+        table.insert(0, "Contains", ["Albendazole", "amoxicillin", "unknown", "ciprofloxacin", "amoxicillin", "albendazole", "ciprofloxacin"])
+        return table
+
+    @staticmethod
+    def expected(model, table):
+        expected = []
+        for _, row in table.iterrows():
+            drug = row["Contains"].lower()
+            if drug in model:
+                expected.append(float(model.score(row.iloc[1:].to_numpy(dtype=float), drug)))
+            else:
+                expected.append(np.nan)
+        return np.array(expected)
+
+    def test_dataframe(self, coefficients_file, feature_table):
+        model = padanalytics.pls(coefficients_file)
+        result = model.quantities_from_features(feature_table)
+        assert list(result.index) == list(feature_table.index)
+        assert np.allclose(result.to_numpy(), self.expected(model.model, feature_table), equal_nan=True)
+        # columns are picked by name, not position
+        shuffled = feature_table[feature_table.columns[::-1]]
+        assert np.allclose(model.quantities_from_features(shuffled), result, equal_nan=True)
+
+    def test_memory_mapped_file(self, coefficients_file, feature_table, tmp_path):
+        model = pad_analysis.pls(coefficients_file)
+        path = tmp_path / "features.npy"
+        np.save(path, feature_table.iloc[:, 1:].to_numpy(dtype=np.float32))
+        drugs = feature_table["Contains"].tolist()
+        result = model.quantities_from_features(str(path), drugs)
+        assert np.allclose(result, self.expected(model.model, feature_table), equal_nan=True)
+        chunked = model.model.score_rows(np.load(path, mmap_mode="r"), [d.lower() for d in drugs], chunk_size=3)
+        assert np.allclose(chunked, result, equal_nan=True)
+
+    def test_array_needs_drugs(self, coefficients_file):
+        with pytest.raises(ValueError):
+            padanalytics.pls(coefficients_file).quantities_from_features(np.zeros((2, 360)))